@@ -0,0 +1,5 @@
+from .factory import create_app
+
+
+# Auth + chat history only. Starts without importing torch or the NLP stack.
+app = create_app("api")
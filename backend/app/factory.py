@@ -0,0 +1,75 @@
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+from .routes.auth import router as auth_router
+from .routes.chats import router as chats_router
+from .services import archive
+from .database import connect_to_mongo, close_mongo_connection, get_db
+
+
+# Router profiles that can be served by separate processes:
+#   api        auth + chat history; never imports the NLP stack (torch, sentence-transformers, genai)
+#   inference  message generation, voice and admin tools; loads the embedding model and KB index
+#   all        both, in one process
+PROFILES = ("api", "inference", "all")
+
+
+def create_app(profile: str = "all") -> FastAPI:
+	if profile not in PROFILES:
+		raise ValueError(f"Unknown app profile {profile!r}; expected one of {', '.join(PROFILES)}")
+	serve_api = profile in ("api", "all")
+	serve_inference = profile in ("inference", "all")
+
+	app = FastAPI(title="DoJ Chatbot API", version="1.0.0")
+
+	app.add_middleware(
+		CORSMiddleware,
+		allow_origins=["*"],
+		allow_credentials=True,
+		allow_methods=["*"],
+		allow_headers=["*"],
+	)
+
+	if serve_inference:
+		# Heavy imports live only on this path
+		from .routes.admin import router as admin_router
+		from .routes.generation import router as generation_router
+		from .routes.voice import router as voice_router
+		from .services import kb_watcher, preanswer
+		from .services.nlp import load_nlp_resources
+
+	@app.on_event("startup")
+	async def on_startup() -> None:
+		await connect_to_mongo()
+		if serve_api:
+			await archive.ensure_indexes(get_db())
+			archive.start_scheduler(get_db())
+		if serve_inference:
+			await load_nlp_resources()
+			# Knowledge base is loaded from backend/knowledge_base.txt by load_nlp_resources().
+			await preanswer.load_precomputed_answers(get_db())
+			preanswer.start_scheduler(get_db())
+			kb_watcher.start_watcher(get_db())
+
+	@app.on_event("shutdown")
+	async def on_shutdown() -> None:
+		if serve_api:
+			archive.stop_scheduler()
+		if serve_inference:
+			preanswer.stop_scheduler()
+			kb_watcher.stop_watcher()
+		await close_mongo_connection()
+
+	if serve_api:
+		app.include_router(auth_router, prefix="/auth", tags=["auth"])
+		app.include_router(chats_router, prefix="/chats", tags=["chats"])
+	if serve_inference:
+		app.include_router(generation_router, prefix="/chats", tags=["chats"])
+		app.include_router(admin_router, prefix="/admin", tags=["admin"])
+		app.include_router(voice_router, prefix="/voice", tags=["voice"])
+
+	@app.get("/health")
+	async def health() -> dict:
+		return {"status": "ok", "profile": profile}
+
+	return app
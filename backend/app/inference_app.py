@@ -0,0 +1,5 @@
+from .factory import create_app
+
+
+# Message generation, voice and admin tools.
+app = create_app("inference")
@@ -0,0 +1,268 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+
+# Per-user token bucket: sustained rate and burst size
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "20"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+# Global admission control for the generation pipeline
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "8"))
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "32"))
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "10"))
+CHAT_RETRY_AFTER = int(os.getenv("CHAT_RETRY_AFTER", "2"))
+# "reject" answers 503 when shedding; "degrade" falls back to the extractive (non-LLM) answer
+CHAT_SHED_MODE = os.getenv("CHAT_SHED_MODE", "reject").lower()
+# "memory" (single process) or "sqlite" (shared by all workers on this host)
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory").lower()
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH") or os.path.join(tempfile.gettempdir(), "doj_ratelimit.sqlite3")
+
+_WAIT_POLL_SECONDS = 0.02
+
+
+class MemoryLimiterStore:
+	"""Token buckets and admission slots for a single process."""
+
+	def __init__(self) -> None:
+		self._buckets: Dict[str, Tuple[float, float]] = {}
+		self._lock = threading.Lock()
+		self._running = 0
+		self._waiting = 0
+		self._cond: Optional[asyncio.Condition] = None
+
+	def take_token(self, key: str, rate: float, burst: float) -> float:
+		"""Consume one token; return 0 if allowed, else seconds until a token is available."""
+		now = time.monotonic()
+		with self._lock:
+			tokens, last = self._buckets.get(key, (burst, now))
+			tokens = min(burst, tokens + (now - last) * rate)
+			if tokens >= 1:
+				self._buckets[key] = (tokens - 1, now)
+				return 0.0
+			self._buckets[key] = (tokens, now)
+			return (1 - tokens) / rate if rate > 0 else float(CHAT_RETRY_AFTER)
+
+	async def acquire_slot(self, limit: int, max_queue: int, timeout: float) -> Optional[object]:
+		if self._cond is None:
+			self._cond = asyncio.Condition()
+		async with self._cond:
+			if self._running < limit:
+				self._running += 1
+				return True
+			if self._waiting >= max_queue:
+				return None
+			self._waiting += 1
+			try:
+				await asyncio.wait_for(self._cond.wait_for(lambda: self._running < limit), timeout)
+			except asyncio.TimeoutError:
+				return None
+			finally:
+				self._waiting -= 1
+			self._running += 1
+			return True
+
+	async def release_slot(self, ticket: object) -> None:
+		async with self._cond:
+			self._running -= 1
+			self._cond.notify()
+
+	def stats(self) -> Dict[str, int]:
+		return {"running": self._running, "waiting": self._waiting}
+
+
+class SQLiteLimiterStore:
+	"""Token buckets and admission slots in a local SQLite file shared by all workers.
+
+	Slots are rows leased by a worker pid, so slots held by a crashed worker are
+	reclaimed on the next acquire. Waiters are admitted in FIFO order by row id.
+	"""
+
+	def __init__(self, path: str = RATE_LIMIT_DB_PATH) -> None:
+		self._path = path
+		self._local = threading.local()
+		with self._connect() as conn:
+			conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+			conn.execute("CREATE TABLE IF NOT EXISTS slots (id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER, state TEXT)")
+
+	def _connect(self) -> sqlite3.Connection:
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+			conn.execute("PRAGMA journal_mode=WAL")
+			self._local.conn = conn
+		return conn
+
+	def _tx(self) -> sqlite3.Connection:
+		conn = self._connect()
+		conn.execute("BEGIN IMMEDIATE")
+		return conn
+
+	def take_token(self, key: str, rate: float, burst: float) -> float:
+		now = time.time()
+		conn = self._tx()
+		try:
+			row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+			tokens, last = row if row else (burst, now)
+			tokens = min(burst, tokens + (now - last) * rate)
+			allowed = tokens >= 1
+			if allowed:
+				tokens -= 1
+			conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+			conn.execute("COMMIT")
+		except Exception:
+			conn.execute("ROLLBACK")
+			raise
+		if allowed:
+			return 0.0
+		return (1 - tokens) / rate if rate > 0 else float(CHAT_RETRY_AFTER)
+
+	@staticmethod
+	def _pid_alive(pid: int) -> bool:
+		try:
+			os.kill(pid, 0)
+		except ProcessLookupError:
+			return False
+		except PermissionError:
+			return True
+		return True
+
+	def _try_enter(self, limit: int, max_queue: int) -> Tuple[Optional[int], str]:
+		conn = self._tx()
+		try:
+			for (pid,) in conn.execute("SELECT DISTINCT pid FROM slots").fetchall():
+				if not self._pid_alive(pid):
+					conn.execute("DELETE FROM slots WHERE pid = ?", (pid,))
+			running = conn.execute("SELECT COUNT(*) FROM slots WHERE state = 'run'").fetchone()[0]
+			waiting = conn.execute("SELECT COUNT(*) FROM slots WHERE state = 'wait'").fetchone()[0]
+			if running < limit and waiting == 0:
+				state = "run"
+			elif waiting < max_queue:
+				state = "wait"
+			else:
+				conn.execute("COMMIT")
+				return None, "shed"
+			cur = conn.execute("INSERT INTO slots (pid, state) VALUES (?, ?)", (os.getpid(), state))
+			conn.execute("COMMIT")
+			return cur.lastrowid, state
+		except Exception:
+			conn.execute("ROLLBACK")
+			raise
+
+	def _try_promote(self, slot_id: int, limit: int) -> bool:
+		conn = self._tx()
+		try:
+			running = conn.execute("SELECT COUNT(*) FROM slots WHERE state = 'run'").fetchone()[0]
+			head = conn.execute("SELECT MIN(id) FROM slots WHERE state = 'wait'").fetchone()[0]
+			promoted = running < limit and head == slot_id
+			if promoted:
+				conn.execute("UPDATE slots SET state = 'run' WHERE id = ?", (slot_id,))
+			conn.execute("COMMIT")
+			return promoted
+		except Exception:
+			conn.execute("ROLLBACK")
+			raise
+
+	def _delete(self, slot_id: int) -> None:
+		self._connect().execute("DELETE FROM slots WHERE id = ?", (slot_id,))
+
+	def _discard_later(self, slot_id: int) -> None:
+		# Called from cancellation paths, where awaiting is not possible; keeps the
+		# (possibly busy-waiting) SQLite delete off the event loop
+		asyncio.get_running_loop().run_in_executor(None, self._delete, slot_id)
+
+	def _discard_entered(self, enter: "asyncio.Future") -> None:
+		if enter.cancelled() or enter.exception() is not None:
+			return
+		slot_id, _ = enter.result()
+		if slot_id is not None:
+			self._discard_later(slot_id)
+
+	async def acquire_slot(self, limit: int, max_queue: int, timeout: float) -> Optional[object]:
+		# The insert runs in a worker thread that a cancellation cannot stop, so the row it
+		# creates must be removed once it lands or the slot leaks (its pid stays alive)
+		enter = asyncio.ensure_future(asyncio.to_thread(self._try_enter, limit, max_queue))
+		try:
+			slot_id, state = await asyncio.shield(enter)
+		except asyncio.CancelledError:
+			enter.add_done_callback(self._discard_entered)
+			raise
+		if slot_id is None:
+			return None
+		deadline = time.monotonic() + timeout
+		try:
+			while state == "wait":
+				if time.monotonic() >= deadline:
+					await asyncio.to_thread(self._delete, slot_id)
+					return None
+				await asyncio.sleep(_WAIT_POLL_SECONDS)
+				if await asyncio.to_thread(self._try_promote, slot_id, limit):
+					state = "run"
+		except asyncio.CancelledError:
+			# Client went away while queued; give the place back
+			self._discard_later(slot_id)
+			raise
+		return slot_id
+
+	async def release_slot(self, ticket: object) -> None:
+		await asyncio.to_thread(self._delete, int(ticket))
+
+	def stats(self) -> Dict[str, int]:
+		conn = self._connect()
+		running = conn.execute("SELECT COUNT(*) FROM slots WHERE state = 'run'").fetchone()[0]
+		waiting = conn.execute("SELECT COUNT(*) FROM slots WHERE state = 'wait'").fetchone()[0]
+		return {"running": running, "waiting": waiting}
+
+
+_store = None
+
+
+def get_limiter_store():
+	global _store
+	if _store is None:
+		_store = SQLiteLimiterStore() if RATE_LIMIT_STORE == "sqlite" else MemoryLimiterStore()
+	return _store
+
+
+def enforce_user_rate_limit(user_id: str) -> None:
+	"""Raise 429 with Retry-After if `user_id` has exhausted its token bucket."""
+	if RATE_LIMIT_PER_MINUTE <= 0:
+		return
+	retry_after = get_limiter_store().take_token(f"user:{user_id}", RATE_LIMIT_PER_MINUTE / 60.0, RATE_LIMIT_BURST)
+	if retry_after > 0:
+		raise HTTPException(
+			status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+			detail="Too many requests",
+			headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+		)
+
+
+@asynccontextmanager
+async def generation_slot() -> AsyncIterator[bool]:
+	"""Admission control for the generation pipeline.
+
+	Yields True when a slot was acquired. When the queue is full or the wait times out,
+	raises 503 with Retry-After, or yields False if CHAT_SHED_MODE is "degrade" so the
+	caller can serve the non-LLM answer instead.
+	"""
+	store = get_limiter_store()
+	ticket = await store.acquire_slot(CHAT_MAX_CONCURRENCY, CHAT_MAX_QUEUE, CHAT_QUEUE_TIMEOUT)
+	if ticket is None:
+		if CHAT_SHED_MODE == "degrade":
+			yield False
+			return
+		raise HTTPException(
+			status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+			detail="Server is busy, please retry",
+			headers={"Retry-After": str(CHAT_RETRY_AFTER)},
+		)
+	try:
+		yield True
+	finally:
+		await store.release_slot(ticket)
@@ -1,27 +1,36 @@
 import os
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, UploadFile, File, Query, Depends
+from fastapi.responses import StreamingResponse
 
-from ..services import nlp
+from ..database import get_db
+from ..services import archive, nlp, preanswer
+from ..services.batch import parse_questions, stream_ndjson
 
 router = APIRouter()
 
 
+def _require_admin(admin_token: str | None) -> None:
+    expected = os.getenv("ADMIN_TOKEN")
+    if expected:
+        if not admin_token or admin_token != expected:
+            raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
 @router.post("/reindex")
-async def reindex(admin_token: str | None = Header(None)) -> dict:
+async def reindex(admin_token: str | None = Header(None), db=Depends(get_db)) -> dict:
     """Trigger reloading and reindexing of backend/knowledge_base.txt at runtime.
 
     If environment variable ADMIN_TOKEN is set, the request must include the same value
-    in the `admin-token` header.
+    in the `admin-token` header. Queries keep using the previous index until the new one
+    is published. If the KB changed, the precomputed answer table is rebuilt in the background.
     """
-    expected = os.getenv("ADMIN_TOKEN")
-    if expected:
-        if not admin_token or admin_token != expected:
-            raise HTTPException(status_code=401, detail="Invalid admin token")
+    _require_admin(admin_token)
 
-    await nlp.load_nlp_resources()
-    # report number of chunks indexed if available
-    chunks = len(getattr(nlp, "_kb_chunks", []) or [])
-    return {"status": "ok", "indexed_chunks": chunks}
+    previous = nlp.get_kb_version()
+    index = await nlp.reindex_knowledge_base()
+    if index.version != previous:
+        preanswer.schedule_rebuild(db)
+    return {"status": "ok", "indexed_chunks": len(index.chunks), "kb_version": index.version}
 
 
 @router.get("/debug_query")
@@ -30,24 +39,95 @@ async def debug_query(q: str, admin_token: str | None = Header(None)) -> dict:
 
     Requires ADMIN_TOKEN if the env var is set.
     """
-    expected = os.getenv("ADMIN_TOKEN")
-    if expected:
-        if not admin_token or admin_token != expected:
-            raise HTTPException(status_code=401, detail="Invalid admin token")
+    _require_admin(admin_token)
 
-    matches = await nlp._vector_search(q, top_k=5)
+    # One QueryContext for the search and the pipeline run, so the query is encoded once
+    query = nlp.QueryContext(q)
+    index = nlp.get_index()
+    matches = await nlp._vector_search(query, top_k=5, index=index)
     cleaned = [nlp._clean_chunk_text(m) for m, _ in matches]
-    instruct_out = ""
-    qa_out = ""
-    combined = "\n\n".join([m for m, _ in matches])[:8000]
-    if combined:
-        instruct_out = await nlp.run_instruct(q, combined)
-        qa_out = await nlp.run_qa(q, combined)
+    ranked = nlp._rank_matches(query, matches)
+    context = nlp.pack_context(index, [r[0] for r in ranked if r[3] >= nlp.MIN_COMPOSITE_THRESHOLD])
+    answer, trace = await nlp.generate_bot_response_traced(query, None, matches=matches, index=index)
 
     return {
         "query": q,
-        "matches": [{"chunk": c, "score": s} for (c, s), c in zip(matches, cleaned)],
+        "normalized_query": query.normalized,
+        "intent_terms": sorted(query.intent_terms),
+        "intent_phrases": query.intent_phrases,
+        "matches": [{"chunk": c, "score": s} for (_, s), c in zip(matches, cleaned)],
         "cleaned_chunks": cleaned,
-        "instruct_output": instruct_out,
-        "qa_output": qa_out,
+        "context": context,
+        "answer": answer,
+        "trace": trace,
     }
+
+
+@router.post("/batch_answer")
+async def batch_answer(
+    file: UploadFile = File(...),
+    top_k: int = Query(5, ge=1, le=50),
+    batch_size: int = Query(64, ge=1, le=1024),
+    concurrency: int = Query(8, ge=1, le=64),
+    use_faqs: bool = Query(False),
+    admin_token: str | None = Header(None),
+    db=Depends(get_db),
+) -> StreamingResponse:
+    """Answer a file of questions (one per line, or NDJSON with a "question" field).
+
+    Streams NDJSON results as they complete: index, question, answer, branch taken and
+    retrieval scores. Nothing is written to db.messages. Requires ADMIN_TOKEN if set.
+    """
+    _require_admin(admin_token)
+
+    raw = await file.read()
+    questions = parse_questions(raw.decode("utf-8", errors="replace").splitlines())
+    return StreamingResponse(
+        stream_ndjson(
+            questions,
+            db=db if use_faqs else None,
+            top_k=top_k,
+            batch_size=batch_size,
+            concurrency=concurrency,
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/preanswer/rebuild")
+async def preanswer_rebuild(
+    top_k: int = Query(preanswer.PREANSWER_TOP_K, ge=1, le=5000),
+    window_days: int = Query(preanswer.PREANSWER_WINDOW_DAYS, ge=1, le=90),
+    admin_token: str | None = Header(None),
+    db=Depends(get_db),
+) -> dict:
+    """Run the pre-answering job now and return its coverage report. Requires ADMIN_TOKEN if set."""
+    _require_admin(admin_token)
+    return await preanswer.rebuild_precomputed_answers(db, top_k=top_k, window_days=window_days)
+
+
+@router.get("/preanswer/report")
+async def preanswer_report(admin_token: str | None = Header(None), db=Depends(get_db)) -> dict:
+    """Coverage report of the most recent pre-answering run. Requires ADMIN_TOKEN if set."""
+    _require_admin(admin_token)
+    report = preanswer.get_last_report()
+    if report is None:
+        report = await db.preanswer_runs.find_one({}, {"_id": 0}, sort=[("startedAt", -1)])
+    return report or {}
+
+
+@router.post("/archive/run")
+async def archive_run(admin_token: str | None = Header(None), db=Depends(get_db)) -> dict:
+    """Archive cold chats now and return working-set sizes before and after. Requires ADMIN_TOKEN if set."""
+    _require_admin(admin_token)
+    return await archive.run_archive(db)
+
+
+@router.get("/archive/report")
+async def archive_report(admin_token: str | None = Header(None), db=Depends(get_db)) -> dict:
+    """Current working-set sizes and the most recent archive run. Requires ADMIN_TOKEN if set."""
+    _require_admin(admin_token)
+    last = archive.get_last_report()
+    if last is None:
+        last = await db.archive_runs.find_one({}, {"_id": 0}, sort=[("startedAt", -1)])
+    return {"current": await archive.working_set_report(db), "last_run": last or {}}
@@ -7,8 +7,8 @@ from jose import jwt, JWTError
 from bson import ObjectId
 
 from ..database import get_db
-from ..models import ChatPublic, MessageCreate, MessagePublic
-from ..services.nlp import generate_bot_response
+from ..models import ChatPublic, MessagePublic
+from ..services.archive import load_archived_messages
 from ..security import JWT_SECRET
 
 
@@ -59,41 +59,20 @@ async def list_chats(user_id: str = Depends(get_current_user_id), db=Depends(get
 	return chats
 
 
-@router.post("/{chat_id}/message", response_model=MessagePublic)
-async def send_message(chat_id: str, payload: MessageCreate, user_id: str = Depends(get_current_user_id), db=Depends(get_db)) -> MessagePublic:
-	chat = await db.chats.find_one({"_id": ObjectId(chat_id), "userId": ObjectId(user_id)})
-	if not chat:
-		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
-
-	user_msg = {
-		"chatId": ObjectId(chat_id),
-		"sender": "user",
-		"text": payload.text,
-		"timestamp": datetime.now(tz=timezone.utc),
-	}
-	res = await db.messages.insert_one(user_msg)
-	user_msg["_id"] = res.inserted_id
-
-	bot_text = await generate_bot_response(payload.text, db)
-	bot_msg = {
-		"chatId": ObjectId(chat_id),
-		"sender": "bot",
-		"text": bot_text,
-		"timestamp": datetime.now(tz=timezone.utc),
-	}
-	res2 = await db.messages.insert_one(bot_msg)
-	bot_msg["_id"] = res2.inserted_id
-	return serialize_message(bot_msg)
-
-
 @router.get("/{chat_id}/messages", response_model=List[MessagePublic])
 async def get_messages(chat_id: str, user_id: str = Depends(get_current_user_id), db=Depends(get_db)) -> List[MessagePublic]:
 	chat = await db.chats.find_one({"_id": ObjectId(chat_id), "userId": ObjectId(user_id)})
 	if not chat:
 		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
 	messages: List[MessagePublic] = []
-	async for doc in db.messages.find({"chatId": ObjectId(chat_id)}).sort("timestamp", 1):
+	seen = set()
+	# Older chats may have part or all of their history in the cold archive
+	for doc in await load_archived_messages(db, chat):
+		seen.add(doc["_id"])
 		messages.append(serialize_message(doc))
+	async for doc in db.messages.find({"chatId": ObjectId(chat_id)}).sort("timestamp", 1):
+		if doc["_id"] not in seen:
+			messages.append(serialize_message(doc))
 	return messages
 
 
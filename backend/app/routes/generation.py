@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from bson import ObjectId
+
+from ..database import get_db
+from ..models import MessageCreate, MessagePublic
+from ..services.nlp import generate_bot_response
+from ..ratelimit import enforce_user_rate_limit, generation_slot
+from .chats import get_current_user_id, serialize_message
+
+
+# Generation half of the /chats API. Kept apart from routes/chats.py so the
+# history-only "api" profile never imports the NLP stack.
+router = APIRouter()
+
+
+def get_rate_limited_user_id(user_id: str = Depends(get_current_user_id)) -> str:
+	enforce_user_rate_limit(user_id)
+	return user_id
+
+
+@router.post("/{chat_id}/message", response_model=MessagePublic)
+async def send_message(chat_id: str, payload: MessageCreate, user_id: str = Depends(get_rate_limited_user_id), db=Depends(get_db)) -> MessagePublic:
+	chat = await db.chats.find_one({"_id": ObjectId(chat_id), "userId": ObjectId(user_id)})
+	if not chat:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
+
+	# Admission happens before anything is stored so a shed request leaves no orphan user message
+	async with generation_slot() as admitted:
+		user_msg = {
+			"chatId": ObjectId(chat_id),
+			"sender": "user",
+			"text": payload.text,
+			"timestamp": datetime.now(tz=timezone.utc),
+		}
+		res = await db.messages.insert_one(user_msg)
+		user_msg["_id"] = res.inserted_id
+
+		bot_text = await generate_bot_response(payload.text, db, use_llm=admitted)
+	bot_msg = {
+		"chatId": ObjectId(chat_id),
+		"sender": "bot",
+		"text": bot_text,
+		"timestamp": datetime.now(tz=timezone.utc),
+	}
+	res2 = await db.messages.insert_one(bot_msg)
+	bot_msg["_id"] = res2.inserted_id
+	# Lets the archive job find cold chats without scanning db.messages
+	await db.chats.update_one({"_id": ObjectId(chat_id)}, {"$set": {"lastMessageAt": bot_msg["timestamp"]}})
+	return serialize_message(bot_msg)
@@ -1,40 +1,167 @@
-import speech_recognition as sr
-import pyttsx3
+import asyncio
+import json
+from typing import Optional
 
-def listen_and_transcribe(language="en-US"):
-    recognizer = sr.Recognizer()
-    mic = sr.Microphone()
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from starlette.websockets import WebSocketState
 
-    engine = pyttsx3.init()
-    engine.setProperty('rate', 180)
+from ..database import get_db
+from ..ratelimit import enforce_user_rate_limit, generation_slot
+from ..services.nlp import generate_bot_response
+from ..services.voice import (
+    DEFAULT_SAMPLE_RATE,
+    EnergyVAD,
+    STTSession,
+    get_stt_backend,
+    get_tts_backend,
+    parse_sample_rate,
+    split_sentences,
+)
+from .chats import get_current_user_id
 
-    print("voice assistant is listening... (Say 'exit' to stop)")
+router = APIRouter()
 
-    while True:
-        try:
-            with mic as source:
-                recognizer.adjust_for_ambient_noise(source)
-                print("🎤 Listening...")
-                audio = recognizer.listen(source)
+AUDIO_CHUNK_BYTES = 8192
 
-            print("⏳ Recognizing...")
-            text = recognizer.recognize_google(audio, language=language)
-            print(f"🗣 You said: {text}")
 
-            if text.lower() in ["exit", "quit", "stop"]:
-                engine.say("Goodbye!")
-                engine.runAndWait()
-                break
+@router.websocket("/stream")
+async def voice_stream(websocket: WebSocket, token: str = "", language: str = "en-US", db=Depends(get_db)) -> None:
+    """Full-duplex voice chat.
+
+    Client -> server: binary frames of mono 16-bit PCM (16 kHz unless changed with
+    {"type": "config", "sample_rate": N}, N one of 8000/16000/22050/44100/48000);
+    {"type": "end_utterance"} forces the end of the current utterance.
+    Server -> client: {"type": "speech_start"}, {"type": "partial", "text"},
+    {"type": "final", "text"}, {"type": "answer", "text"}, then for each sentence
+    {"type": "audio", "format": "wav", "bytes": N} followed by binary WAV chunks,
+    and {"type": "audio_end"}. A reply that fails is reported as {"type": "error", "detail"}
+    (with "status" and "retry_after" when rate limited or shed) and the session carries on.
+
+    STT and TTS run in worker threads; retrieval for an utterance starts as soon as it ends,
+    while the client keeps streaming.
+    """
+    await websocket.accept()
+    try:
+        user_id = get_current_user_id(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    try:
+        # First use loads the STT model, which takes seconds; keep it off the event loop
+        stt = await asyncio.to_thread(get_stt_backend)
+        tts = await asyncio.to_thread(get_tts_backend)
+    except Exception as e:
+        print(f"Voice backend unavailable: {e}")
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        return
+    if not stt.supports(language):
+        await websocket.send_text(json.dumps({"type": "error", "detail": f"Unsupported language: {language}"}))
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    sample_rate = DEFAULT_SAMPLE_RATE
+    vad = EnergyVAD(sample_rate)
+    session: Optional[STTSession] = None
+    send_lock = asyncio.Lock()
+    replies: "asyncio.Queue[asyncio.Task]" = asyncio.Queue()
 
-            response = f"You said: {text}"
-            engine.say(response)
-            engine.runAndWait()
+    async def send_json(payload: dict) -> None:
+        async with send_lock:
+            await websocket.send_text(json.dumps(payload))
 
-        except sr.UnknownValueError:
-            print("❗ Could not understand audio")
-        except sr.RequestError:
-            print("⚠️ Could not connect to Google API")
+    async def answer(text: str) -> str:
+        # Same per-user bucket and global admission control as POST /chats/{id}/message
+        # With the SQLite store this takes a file lock; keep it off the event loop
+        await asyncio.to_thread(enforce_user_rate_limit, user_id)
+        async with generation_slot() as admitted:
+            return await generate_bot_response(text, db, use_llm=admitted)
 
-if __name__ == "__main__":
-    language = input("Enter language code (e.g., en-US): ").strip() or "en-US"
-    listen_and_transcribe(language)
+    async def speak(task: asyncio.Task) -> None:
+        answer_text = await task
+        await send_json({"type": "answer", "text": answer_text})
+        for sentence in split_sentences(answer_text):
+            wav = await asyncio.to_thread(tts.synthesize, sentence)
+            async with send_lock:
+                await websocket.send_text(json.dumps({"type": "audio", "format": "wav", "bytes": len(wav)}))
+                for i in range(0, len(wav), AUDIO_CHUNK_BYTES):
+                    await websocket.send_bytes(wav[i:i + AUDIO_CHUNK_BYTES])
+        await send_json({"type": "audio_end"})
+
+    async def reply_writer() -> None:
+        # Replies are spoken in utterance order even though retrieval runs concurrently
+        while True:
+            task = await replies.get()
+            try:
+                await speak(task)
+                continue
+            except WebSocketDisconnect:
+                return
+            except HTTPException as e:
+                # Rate limited or shed: tell the client when to try again
+                error = {
+                    "type": "error",
+                    "status": e.status_code,
+                    "detail": e.detail,
+                    "retry_after": int((e.headers or {}).get("Retry-After", 0)),
+                }
+            except Exception as e:
+                if websocket.client_state != WebSocketState.CONNECTED:
+                    # Socket is gone; the receive loop will notice and clean up
+                    return
+                print(f"Voice reply failed: {e}")
+                error = {"type": "error", "detail": "Could not answer that, please try again"}
+            try:
+                await send_json(error)
+            except Exception:
+                return
+
+    async def handle(events) -> None:
+        nonlocal session
+        for event, frame in events:
+            if event == "start":
+                session = await asyncio.to_thread(stt.new_session, sample_rate, language)
+                await send_json({"type": "speech_start"})
+            elif event == "audio" and session is not None:
+                partial = await asyncio.to_thread(session.accept, frame)
+                if partial:
+                    await send_json({"type": "partial", "text": partial})
+            elif event == "end" and session is not None:
+                text = await asyncio.to_thread(session.finish)
+                session = None
+                await send_json({"type": "final", "text": text})
+                if text.strip():
+                    replies.put_nowait(asyncio.create_task(answer(text)))
+
+    writer = asyncio.create_task(reply_writer())
+    try:
+        while True:
+            msg = await websocket.receive()
+            if msg["type"] == "websocket.disconnect":
+                break
+            if msg.get("bytes"):
+                await handle(list(vad.feed(msg["bytes"])))
+            elif msg.get("text"):
+                try:
+                    control = json.loads(msg["text"])
+                except json.JSONDecodeError:
+                    continue
+                if not isinstance(control, dict):
+                    continue
+                kind = control.get("type")
+                if kind == "config" and not vad.in_speech:
+                    rate = parse_sample_rate(control.get("sample_rate") or DEFAULT_SAMPLE_RATE)
+                    if rate is None:
+                        await send_json({"type": "error", "detail": "Unsupported sample_rate"})
+                        continue
+                    sample_rate = rate
+                    vad = EnergyVAD(sample_rate)
+                elif kind == "end_utterance":
+                    await handle(list(vad.flush()))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        writer.cancel()
+        # Don't keep generating answers nobody will hear
+        while not replies.empty():
+            replies.get_nowait().cancel()
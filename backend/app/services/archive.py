@@ -0,0 +1,323 @@
+"""Retention for db.messages: hot collection, compressed cold archive and optional TTL.
+
+Chats whose last message is older than MESSAGE_HOT_DAYS are moved out of
+db.messages in batches by a background job, either into db.messages_archive
+("collection") or into zstd-compressed NDJSON segment files on disk ("zstd").
+Each archived chat records where its messages went, and get_messages merges
+them back in when the chat is opened. MESSAGE_TTL_DAYS, if set, purges hot
+and archived messages older than that many days. With several workers only the
+one holding the "message_archive" lease runs the job.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from . import leases
+
+
+MESSAGE_HOT_DAYS = int(os.getenv("MESSAGE_HOT_DAYS", "30"))
+MESSAGE_TTL_DAYS = int(os.getenv("MESSAGE_TTL_DAYS", "0"))  # 0 keeps messages forever
+MESSAGE_ARCHIVE_BACKEND = os.getenv("MESSAGE_ARCHIVE_BACKEND", "collection").lower()
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "message_archive"
+)
+MESSAGE_ARCHIVE_BATCH_CHATS = int(os.getenv("MESSAGE_ARCHIVE_BATCH_CHATS", "100"))
+# Minutes between archive runs; 0 disables the background job
+MESSAGE_ARCHIVE_INTERVAL_MINUTES = int(os.getenv("MESSAGE_ARCHIVE_INTERVAL_MINUTES", "60"))
+# Upper bound on one run; a crashed runner's lease expires after this
+MESSAGE_ARCHIVE_LEASE_SECONDS = int(os.getenv("MESSAGE_ARCHIVE_LEASE_SECONDS", "1800"))
+LEASE_NAME = "message_archive"
+
+# Mongo error codes for an existing index with other options: IndexOptionsConflict, IndexKeySpecsConflict
+_INDEX_OPTIONS_CONFLICT = (85, 86)
+
+_run_lock = asyncio.Lock()
+_last_report: Optional[Dict[str, Any]] = None
+_scheduler_task: Optional[asyncio.Task] = None
+
+
+async def ensure_indexes(db) -> None:
+    """Indexes used by get_messages and the archive job, plus the TTL index if configured."""
+    await db.messages.create_index([("chatId", 1), ("timestamp", 1)])
+    await db.chats.create_index([("lastMessageAt", 1)])
+    if MESSAGE_ARCHIVE_BACKEND == "collection":
+        await db.messages_archive.create_index([("chatId", 1), ("timestamp", 1)])
+    for coll in ("messages", "messages_archive"):
+        if MESSAGE_TTL_DAYS > 0:
+            ttl = MESSAGE_TTL_DAYS * 86400
+            try:
+                await db[coll].create_index("timestamp", expireAfterSeconds=ttl, name="timestamp_ttl")
+            except OperationFailure as e:
+                if e.code not in _INDEX_OPTIONS_CONFLICT:
+                    raise
+                # Index exists with a different expiry; update it in place
+                await db.command("collMod", coll, index={"name": "timestamp_ttl", "expireAfterSeconds": ttl})
+        elif "timestamp_ttl" in await db[coll].index_information():
+            # TTL turned off after being on: stop Mongo from purging anything
+            await db[coll].drop_index("timestamp_ttl")
+
+
+def _to_record(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "_id": str(doc["_id"]),
+        "chatId": str(doc["chatId"]),
+        "sender": doc["sender"],
+        "text": doc["text"],
+        "timestamp": doc["timestamp"].isoformat(),
+    }
+
+
+def _from_record(rec: Dict[str, Any]) -> Dict[str, Any]:
+    ts = datetime.fromisoformat(rec["timestamp"])
+    return {
+        "_id": ObjectId(rec["_id"]),
+        "chatId": ObjectId(rec["chatId"]),
+        "sender": rec["sender"],
+        "text": rec["text"],
+        "timestamp": ts,
+    }
+
+
+def _write_segment(chats: List[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Write one segment file: one independent zstd frame per chat so a chat can be read alone."""
+    import zstandard  # imported lazily; only needed for the "zstd" backend
+
+    os.makedirs(MESSAGE_ARCHIVE_DIR, exist_ok=True)
+    name = f"segment-{datetime.now(tz=timezone.utc).strftime('%Y%m%dT%H%M%S%f')}.ndjson.zst"
+    path = os.path.join(MESSAGE_ARCHIVE_DIR, name)
+    compressor = zstandard.ZstdCompressor(level=10)
+    frames: Dict[str, Dict[str, int]] = {}
+    offset = 0
+    with open(path + ".tmp", "wb") as f:
+        for messages in chats:
+            payload = "".join(json.dumps(_to_record(m), ensure_ascii=False) + "\n" for m in messages)
+            frame = compressor.compress(payload.encode("utf-8"))
+            f.write(frame)
+            frames[str(messages[0]["chatId"])] = {"offset": offset, "length": len(frame)}
+            offset += len(frame)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    return {"file": name, "frames": frames, "bytes": offset}
+
+
+def _read_frame(name: str, offset: int, length: int) -> List[Dict[str, Any]]:
+    import zstandard
+
+    with open(os.path.join(MESSAGE_ARCHIVE_DIR, name), "rb") as f:
+        f.seek(offset)
+        data = zstandard.ZstdDecompressor().decompress(f.read(length))
+    return [_from_record(json.loads(line)) for line in data.decode("utf-8").splitlines() if line]
+
+
+async def load_archived_messages(db, chat: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Messages of `chat` that were moved out of db.messages, oldest first, each once."""
+    if not chat.get("archivedThrough") and not chat.get("archiveSegments"):
+        return []
+    docs: Dict[ObjectId, Dict[str, Any]] = {}
+    async for doc in db.messages_archive.find({"chatId": chat["_id"]}).sort("timestamp", 1):
+        docs.setdefault(doc["_id"], doc)
+    for seg in chat.get("archiveSegments", []):
+        try:
+            frame = await asyncio.to_thread(_read_frame, seg["file"], seg["offset"], seg["length"])
+        except FileNotFoundError:
+            # Segment purged by the TTL
+            continue
+        # A run that crashed before deleting the hot copies archives them again on the next run
+        for doc in frame:
+            docs.setdefault(doc["_id"], doc)
+    return sorted(docs.values(), key=lambda d: d["timestamp"])
+
+
+async def _collection_stats(db, name: str) -> Dict[str, int]:
+    try:
+        stats = await db.command("collStats", name)
+    except Exception:
+        return {"count": 0, "size": 0, "storageSize": 0, "totalIndexSize": 0}
+    return {k: int(stats.get(k, 0)) for k in ("count", "size", "storageSize", "totalIndexSize")}
+
+
+async def working_set_report(db) -> Dict[str, Any]:
+    """Size of the hot collection (data + indexes) and of the archive."""
+    hot = await _collection_stats(db, "messages")
+    report: Dict[str, Any] = {"hot": hot, "hotWorkingSetBytes": hot["size"] + hot["totalIndexSize"]}
+    if MESSAGE_ARCHIVE_BACKEND == "collection":
+        report["archive"] = await _collection_stats(db, "messages_archive")
+    else:
+        total = 0
+        if os.path.isdir(MESSAGE_ARCHIVE_DIR):
+            total = sum(e.stat().st_size for e in os.scandir(MESSAGE_ARCHIVE_DIR) if e.name.endswith(".zst"))
+        report["archive"] = {"segmentBytes": total}
+    return report
+
+
+async def _backfill_last_message_at(db) -> None:
+    # Chats created before lastMessageAt was tracked
+    async for chat in db.chats.find({"lastMessageAt": {"$exists": False}}, {"createdAt": 1}).limit(MESSAGE_ARCHIVE_BATCH_CHATS * 10):
+        latest = await db.messages.find_one({"chatId": chat["_id"]}, {"timestamp": 1}, sort=[("timestamp", -1)])
+        last = latest["timestamp"] if latest else chat["createdAt"]
+        await db.chats.update_one({"_id": chat["_id"]}, {"$set": {"lastMessageAt": last}})
+
+
+async def _archive_batch(db, cutoff: datetime) -> int:
+    chats = []
+    query = {
+        "lastMessageAt": {"$lt": cutoff},
+        "$or": [
+            {"archivedThrough": {"$exists": False}},
+            {"$expr": {"$lt": ["$archivedThrough", "$lastMessageAt"]}},
+        ],
+    }
+    async for chat in db.chats.find(query, {"_id": 1, "archiveSegments.last": 1}).limit(MESSAGE_ARCHIVE_BATCH_CHATS):
+        messages = []
+        async for doc in db.messages.find({"chatId": chat["_id"]}).sort("timestamp", 1):
+            messages.append(doc)
+        chats.append((chat["_id"], messages, max((seg["last"] for seg in chat.get("archiveSegments", [])), default=None)))
+
+    if not chats:
+        return 0
+
+    # Order matters for crash safety: write the archive, then record it on the chat,
+    # then delete from the hot collection. A crash in between leaves duplicates, which
+    # load_archived_messages and get_messages drop, never a gap.
+    non_empty = [m for _, m, _ in chats if m]
+    if non_empty and MESSAGE_ARCHIVE_BACKEND == "zstd":
+        # Messages already in a segment from a run that crashed before deleting them
+        # are not written again
+        fresh = [[m for m in messages if archived is None or m["timestamp"] > archived] for _, messages, archived in chats]
+        to_write = [m for m in fresh if m]
+        segment = await asyncio.to_thread(_write_segment, to_write) if to_write else {"frames": {}}
+        for (chat_id, _, _), messages in zip(chats, fresh):
+            frame = segment["frames"].get(str(chat_id))
+            if frame:
+                await db.chats.update_one(
+                    {"_id": chat_id},
+                    {"$push": {"archiveSegments": {"file": segment["file"], **frame, "last": messages[-1]["timestamp"]}}},
+                )
+    elif non_empty:
+        for messages in non_empty:
+            try:
+                await db.messages_archive.insert_many(messages, ordered=False)
+            except BulkWriteError as e:
+                # Re-run after a partial failure: already archived ids are duplicates.
+                # Anything else must abort before the hot copies are deleted.
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+
+    for chat_id, messages, _ in chats:
+        through = messages[-1]["timestamp"] if messages else cutoff
+        await db.chats.update_one({"_id": chat_id}, {"$set": {"archivedThrough": through}})
+        if messages:
+            await db.messages.delete_many({"_id": {"$in": [m["_id"] for m in messages]}})
+    return len(chats)
+
+
+def _purge_segment_files(cutoff: datetime, referenced: Dict[str, datetime]) -> List[str]:
+    removed = []
+    for name, last in referenced.items():
+        if last < cutoff:
+            try:
+                os.remove(os.path.join(MESSAGE_ARCHIVE_DIR, name))
+            except FileNotFoundError:
+                pass
+            removed.append(name)
+    return removed
+
+
+async def _purge_expired_segments(db, cutoff: datetime) -> int:
+    """TTL for on-disk segments: drop a segment once every chat frame in it has expired."""
+    newest: Dict[str, datetime] = {}
+    async for chat in db.chats.find({"archiveSegments": {"$exists": True}}, {"archiveSegments": 1}):
+        for seg in chat.get("archiveSegments", []):
+            last = seg["last"]
+            if last.tzinfo is None:
+                last = last.replace(tzinfo=timezone.utc)
+            newest[seg["file"]] = max(newest.get(seg["file"], last), last)
+    removed = await asyncio.to_thread(_purge_segment_files, cutoff, newest)
+    if removed:
+        await db.chats.update_many(
+            {"archiveSegments.file": {"$in": removed}},
+            {"$pull": {"archiveSegments": {"file": {"$in": removed}}}},
+        )
+    return len(removed)
+
+
+async def run_archive(db, max_batches: int = 1000) -> Dict[str, Any]:
+    """Move cold chats out of db.messages and report the working set before and after.
+
+    If another worker holds the archive lease nothing is done and the report has
+    "skipped" set.
+    """
+    async with _run_lock:
+        async with leases.job_lease(db, LEASE_NAME, MESSAGE_ARCHIVE_LEASE_SECONDS) as acquired:
+            if not acquired:
+                return {"skipped": True, "reason": "archive running in another worker"}
+            return await _run(db, max_batches)
+
+
+async def _run(db, max_batches: int) -> Dict[str, Any]:
+    global _last_report
+    started = datetime.now(tz=timezone.utc)
+    before = await working_set_report(db)
+    await _backfill_last_message_at(db)
+    cutoff = started - timedelta(days=MESSAGE_HOT_DAYS)
+    archived = 0
+    for _ in range(max_batches):
+        n = await _archive_batch(db, cutoff)
+        archived += n
+        if n < MESSAGE_ARCHIVE_BATCH_CHATS:
+            break
+    purged_segments = 0
+    if MESSAGE_TTL_DAYS > 0 and MESSAGE_ARCHIVE_BACKEND == "zstd":
+        purged_segments = await _purge_expired_segments(db, started - timedelta(days=MESSAGE_TTL_DAYS))
+    after = await working_set_report(db)
+    report = {
+        "startedAt": started,
+        "backend": MESSAGE_ARCHIVE_BACKEND,
+        "hotDays": MESSAGE_HOT_DAYS,
+        "ttlDays": MESSAGE_TTL_DAYS,
+        "archivedChats": archived,
+        "purgedSegments": purged_segments,
+        "before": before,
+        "after": after,
+    }
+    await db.archive_runs.insert_one(dict(report))
+    _last_report = report
+    print(
+        f"Archived {archived} chats; hot working set "
+        f"{before['hotWorkingSetBytes']} -> {after['hotWorkingSetBytes']} bytes"
+    )
+    return report
+
+
+def get_last_report() -> Optional[Dict[str, Any]]:
+    return _last_report
+
+
+async def _run_periodically(db, minutes: int) -> None:
+    while True:
+        await asyncio.sleep(minutes * 60)
+        try:
+            await run_archive(db)
+        except Exception as e:
+            print(f"Message archive run failed: {e}")
+
+
+def start_scheduler(db) -> None:
+    """Start the background archive job if MESSAGE_ARCHIVE_INTERVAL_MINUTES is positive."""
+    global _scheduler_task
+    if MESSAGE_ARCHIVE_INTERVAL_MINUTES <= 0 or _scheduler_task is not None:
+        return
+    _scheduler_task = asyncio.create_task(_run_periodically(db, MESSAGE_ARCHIVE_INTERVAL_MINUTES))
+
+
+def stop_scheduler() -> None:
+    global _scheduler_task
+    if _scheduler_task is not None:
+        _scheduler_task.cancel()
+        _scheduler_task = None
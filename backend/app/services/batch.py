@@ -0,0 +1,51 @@
+import json
+from typing import Any, AsyncIterator, Dict, Iterable, List
+
+from . import nlp
+
+
+def parse_questions(lines: Iterable[str]) -> List[str]:
+    """Parse a questions file.
+
+    Each non-empty line is either a plain-text question or a JSON object with a
+    "question" (or "text") field, so NDJSON exports can be fed back in directly.
+    """
+    questions: List[str] = []
+    for raw in lines:
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError:
+                questions.append(line)
+                continue
+            q = obj.get("question") or obj.get("text") or ""
+            if str(q).strip():
+                questions.append(str(q).strip())
+            continue
+        questions.append(line)
+    return questions
+
+
+async def stream_ndjson(
+    questions: List[str],
+    db=None,
+    top_k: int = 5,
+    batch_size: int = 64,
+    concurrency: int = 8,
+) -> AsyncIterator[str]:
+    """Answer `questions` and yield one JSON line per result."""
+    async for result in nlp.answer_questions_batch(
+        questions, db=db, top_k=top_k, batch_size=batch_size, concurrency=concurrency
+    ):
+        yield json.dumps(result, ensure_ascii=False) + "\n"
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Count results per branch taken in generate_bot_response."""
+    branches: Dict[str, int] = {}
+    for r in results:
+        branches[r.get("branch", "")] = branches.get(r.get("branch", ""), 0) + 1
+    return {"total": len(results), "branches": branches}
@@ -0,0 +1,67 @@
+"""Optional auto-reload of the KB index when knowledge_base.txt changes.
+
+Enabled with KB_WATCH=1. The file is polled (no extra dependency, works on any
+filesystem including bind mounts); a change triggers a rebuild only once the file
+has been quiet for KB_WATCH_DEBOUNCE seconds, so an editor's save-in-several-writes
+or a copy in progress causes a single reindex.
+"""
+import asyncio
+import os
+from typing import Optional, Tuple
+
+from . import nlp, preanswer
+
+
+KB_WATCH = os.getenv("KB_WATCH", "").lower() in ("1", "true", "yes")
+KB_WATCH_INTERVAL = float(os.getenv("KB_WATCH_INTERVAL", "2"))
+KB_WATCH_DEBOUNCE = float(os.getenv("KB_WATCH_DEBOUNCE", "3"))
+
+_watch_task: Optional[asyncio.Task] = None
+
+
+def _file_state(path: str) -> Optional[Tuple[float, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+async def _watch(db, path: str) -> None:
+    last = _file_state(path)
+    while True:
+        await asyncio.sleep(KB_WATCH_INTERVAL)
+        current = _file_state(path)
+        if current == last:
+            continue
+        # Debounce: wait until the file stops changing
+        while True:
+            await asyncio.sleep(KB_WATCH_DEBOUNCE)
+            settled = _file_state(path)
+            if settled == current:
+                break
+            current = settled
+        last = current
+        try:
+            previous = nlp.get_kb_version()
+            index = await nlp.reindex_knowledge_base(path)
+            print(f"Knowledge base changed on disk; indexed {len(index.chunks)} chunks")
+            if index.version != previous and db is not None:
+                preanswer.schedule_rebuild(db)
+        except Exception as e:
+            print(f"Knowledge base reload failed: {e}")
+
+
+def start_watcher(db=None, path: Optional[str] = None) -> None:
+    """Start watching the KB file if KB_WATCH is enabled."""
+    global _watch_task
+    if not KB_WATCH or _watch_task is not None:
+        return
+    _watch_task = asyncio.create_task(_watch(db, path or nlp.KNOWLEDGE_BASE_PATH))
+
+
+def stop_watcher() -> None:
+    global _watch_task
+    if _watch_task is not None:
+        _watch_task.cancel()
+        _watch_task = None
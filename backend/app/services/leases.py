@@ -0,0 +1,62 @@
+"""Mongo-backed leases so a periodic job runs in only one worker at a time.
+
+Every API/inference worker starts the same schedulers. Before doing any work a
+job takes the lease for its name in db.job_leases. The lease is a single
+document that one owner holds until it releases it or it expires. An expired
+lease (its holder crashed) can be taken over.
+"""
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+# Identifies this process as a lease owner
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def acquire_lease(db, name: str, ttl_seconds: float) -> bool:
+    """Take (or renew) the lease `name` for this process; False if another live owner holds it."""
+    now = datetime.now(tz=timezone.utc)
+    try:
+        doc = await db.job_leases.find_one_and_update(
+            {"_id": name, "$or": [{"expiresAt": {"$lte": now}}, {"owner": OWNER_ID}]},
+            {"$set": {"owner": OWNER_ID, "acquiredAt": now, "expiresAt": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # The lease document exists and the filter didn't match: someone else holds it
+        return False
+    return doc is not None and doc.get("owner") == OWNER_ID
+
+
+async def release_lease(db, name: str) -> None:
+    await db.job_leases.delete_one({"_id": name, "owner": OWNER_ID})
+
+
+async def lease_held(db, name: str) -> bool:
+    """True if any owner currently holds an unexpired lease `name`."""
+    doc = await db.job_leases.find_one({"_id": name})
+    return doc is not None and _aware(doc["expiresAt"]) > datetime.now(tz=timezone.utc)
+
+
+@asynccontextmanager
+async def job_lease(db, name: str, ttl_seconds: float) -> AsyncIterator[bool]:
+    """Yield True if this process got the lease (released on exit), else False."""
+    acquired = await acquire_lease(db, name, ttl_seconds)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            await release_lease(db, name)
+
+
+def _aware(dt: datetime) -> datetime:
+    # Motor returns naive UTC datetimes unless the client is tz_aware
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
@@ -1,21 +1,83 @@
+import asyncio
+import hashlib
 import os
 import re
-from typing import List, Tuple, Optional
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Tuple, Optional, Set, Union
 
+import torch
 from sentence_transformers import SentenceTransformer, util
 from google import genai
 from google.genai import types
 
 
+KNOWLEDGE_BASE_PATH = os.getenv("KNOWLEDGE_BASE_PATH") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "knowledge_base.txt"
+)
+
+
+class KBIndex:
+    """Immutable snapshot of the knowledge-base index.
+
+    A new snapshot is built off to the side and published by rebinding `_index`, so a
+    reader that grabbed the old snapshot keeps consistent chunks and embeddings.
+    """
+
+    __slots__ = ("chunks", "embeddings", "version", "paragraphs", "sections", "spans", "position")
+
+    def __init__(
+        self,
+        chunks: Tuple[str, ...],
+        embeddings,
+        version: str,
+        paragraphs: Tuple[str, ...] = (),
+        sections: Tuple[str, ...] = (),
+        spans: Tuple[Tuple[int, int, int], ...] = (),
+    ) -> None:
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.version = version
+        # Where each chunk came from, for context packing: spans[i] = (paragraph, start, end)
+        # into paragraphs, and sections[p] is the "Title:" section paragraph p belongs to.
+        self.paragraphs = paragraphs
+        self.sections = sections
+        self.spans = spans
+        self.position: Dict[str, int] = {c: i for i, c in enumerate(chunks)}
+
+    def __bool__(self) -> bool:
+        return bool(self.chunks) and self.embeddings is not None
+
+
 # In-memory index built at startup from backend/knowledge_base.txt
 _embed_model: Optional[SentenceTransformer] = None
-_kb_chunks: List[str] = []
-_kb_embeddings = None
+_index = KBIndex((), None, "")
+_index_lock = asyncio.Lock()
 _gemini_client = None
 
+# Precomputed answers for frequent questions (see services/preanswer.py).
+# Held as one tuple (questions, answers, embeddings, kb_version) so it is swapped atomically.
+_precomputed: Tuple[List[str], List[str], Any, str] = ([], [], None, "")
+
 # Configuration for confidence thresholds
 MIN_CONFIDENCE_THRESHOLD = 0.25  # Lowered from 0.35 - be more permissive
 MIN_COMPOSITE_THRESHOLD = 0.30   # Lowered from 0.40 - be more permissive
+PRECOMPUTED_MATCH_THRESHOLD = 0.90  # Query must be a near-paraphrase of a precomputed question
+
+# Prompt context budget (estimated tokens) filled by pack_context in relevance order. The
+# default fits two full 1000-char chunks, so only deduplication shrinks the context and the
+# second-ranked chunk is never dropped; lower it only with answer-quality data to back it
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "512"))
+# At most this many ranked chunks are considered; with the default of 2 the packed context
+# is never larger than the old top-2 join (the 0.2 keyword boost makes most legal queries
+# clear the composite threshold with 4-5 chunks, which would otherwise all be packed)
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "2"))
+CHARS_PER_TOKEN = 4  # rough estimate for English text
+
+# Process-wide LRU of query embeddings keyed by normalized text
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+_embedding_cache: "OrderedDict[str, Any]" = OrderedDict()
+_embedding_cache_lock = threading.Lock()
 
 # Legal keywords for intent detection
 LEGAL_KEYWORDS = {
@@ -79,39 +141,96 @@ LEGAL_KEYWORDS = {
 }
 
 
-def _is_legal_query(query: str) -> bool:
-    """Check if the query contains legal-related keywords."""
-    query_lower = query.lower()
-    query_words = set(re.findall(r'\b\w+\b', query_lower))
-    
-    # Check for direct legal keyword matches
-    if query_words & LEGAL_KEYWORDS:
-        return True
-    
-    # Check for common legal phrases
-    legal_phrases = [
-        "how to file", "where to file", "where to report", "how to report",
-        "guide me", "please guide", "process of filing", "filing process",
-        "step by step", "what is the procedure", "how do i", "what should i do",
-        "legal aid", "consumer complaint", "police complaint", "cyber crime", 
-        "land dispute", "family dispute", "lost document", "duplicate", 
-        "aadhaar", "aadhar", "licence", "license", "court case", "legal advice", 
-        "lawyer", "advocate", "fir", "complaint", "tell me the url", "give me link",
-        "website", "portal", "online registration", "how to apply", "filing the case",
-        "file a case", "court procedure", "what documents", "which court",
-        "legal process", "procedure", "next steps", "what to do next"
-    ]
-    
-    for phrase in legal_phrases:
-        if phrase in query_lower:
-            return True
-    
-    # Additional check: if query contains process/procedure words + any legal keyword
-    process_words = ["process", "procedure", "guide", "steps", "how", "what", "filing", "file"]
-    if any(word in query_lower for word in process_words) and query_words & LEGAL_KEYWORDS:
-        return True
-    
-    return False
+# Common legal phrases for intent detection
+LEGAL_PHRASES = [
+    "how to file", "where to file", "where to report", "how to report",
+    "guide me", "please guide", "process of filing", "filing process",
+    "step by step", "what is the procedure", "how do i", "what should i do",
+    "legal aid", "consumer complaint", "police complaint", "cyber crime", 
+    "land dispute", "family dispute", "lost document", "duplicate", 
+    "aadhaar", "aadhar", "licence", "license", "court case", "legal advice", 
+    "lawyer", "advocate", "fir", "complaint", "tell me the url", "give me link",
+    "website", "portal", "online registration", "how to apply", "filing the case",
+    "file a case", "court procedure", "what documents", "which court",
+    "legal process", "procedure", "next steps", "what to do next"
+]
+
+URL_QUERY_WORDS = ["url", "link", "website", "portal", "tell me the"]
+IMPORTANT_KEYWORDS = {"cyber", "crime", "consumer", "complaint", "aadhaar", "licence", "legal", "aid"}
+
+
+def _token_set(s: str) -> Set[str]:
+    toks = [t.lower() for t in re.split(r"\W+", s) if len(t) > 2]
+    return set(toks)
+
+
+class QueryContext:
+    """Per-request view of the user query, computed once and shared by every pipeline stage.
+
+    The embedding is resolved lazily through the process-wide LRU, so a request that
+    never reaches retrieval never touches the model, and one that does encodes at most once.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.normalized = " ".join(text.lower().split())
+        self.words: Set[str] = set(re.findall(r'\b\w+\b', self.normalized))
+        self.tokens = _token_set(self.normalized)
+        self.intent_terms: Set[str] = self.words & LEGAL_KEYWORDS
+        self.intent_phrases: List[str] = [p for p in LEGAL_PHRASES if p in self.normalized]
+        self.wants_url = any(word in self.normalized for word in URL_QUERY_WORDS)
+        self._embedding = None
+
+    @property
+    def embedding(self):
+        if self._embedding is None:
+            self._embedding = _encode_cached([self.normalized])[0]
+        return self._embedding
+
+    @property
+    def has_embedding(self) -> bool:
+        return self._embedding is not None
+
+
+def _as_query(query: Union[str, QueryContext]) -> QueryContext:
+    return query if isinstance(query, QueryContext) else QueryContext(query)
+
+
+def _encode_cached(texts: List[str]):
+    """Embeddings for `texts` (one row each), encoding only cache misses in a single model call.
+
+    Texts should already be normalized; all-MiniLM-L6-v2 is uncased, so lowercasing does
+    not change the embedding.
+    """
+    rows: Dict[str, Any] = {}
+    with _embedding_cache_lock:
+        for t in texts:
+            if t in _embedding_cache:
+                _embedding_cache.move_to_end(t)
+                rows[t] = _embedding_cache[t]
+    misses = list(dict.fromkeys(t for t in texts if t not in rows))
+    if misses:
+        embs = _embed_model.encode(misses, convert_to_tensor=True, normalize_embeddings=True)
+        with _embedding_cache_lock:
+            for t, e in zip(misses, embs):
+                rows[t] = e
+                if QUERY_EMBEDDING_CACHE_SIZE > 0:
+                    _embedding_cache[t] = e
+                    _embedding_cache.move_to_end(t)
+            while len(_embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+    return torch.stack([rows[t] for t in texts])
+
+
+def clear_embedding_cache() -> None:
+    with _embedding_cache_lock:
+        _embedding_cache.clear()
+
+
+def _is_legal_query(query: Union[str, QueryContext]) -> bool:
+    """Check if the query contains legal-related keywords or phrases."""
+    q = _as_query(query)
+    return bool(q.intent_terms or q.intent_phrases)
 
 
 def _read_knowledge_base(path: str) -> str:
@@ -125,24 +244,120 @@ def _read_knowledge_base(path: str) -> str:
         return ""
 
 
-def _chunk_text(text: str, chunk_size: int = 800, overlap: int = 100) -> List[str]:
-    """Simple sliding-window text chunker."""
+def _chunk_spans(text: str, chunk_size: int = 800, overlap: int = 100) -> Tuple[List[str], List[Tuple[int, int, int]]]:
+    """Sliding-window chunking that also reports where each chunk came from.
+
+    Returns the paragraphs and one (paragraph index, start, end) span per chunk.
+    """
     if not text:
-        return []
+        return [], []
     paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
-    chunks: List[str] = []
-    for p in paragraphs:
+    spans: List[Tuple[int, int, int]] = []
+    for i, p in enumerate(paragraphs):
         if len(p) <= chunk_size:
-            chunks.append(p)
+            spans.append((i, 0, len(p)))
         else:
             start = 0
             while start < len(p):
                 end = min(start + chunk_size, len(p))
-                chunks.append(p[start:end])
+                spans.append((i, start, end))
                 if end == len(p):
                     break
                 start = end - overlap if end - overlap > start else end
-    return chunks
+    return paragraphs, spans
+
+
+def _chunk_text(text: str, chunk_size: int = 800, overlap: int = 100) -> List[str]:
+    """Simple sliding-window text chunker."""
+    paragraphs, spans = _chunk_spans(text, chunk_size, overlap)
+    return [paragraphs[p][start:end] for p, start, end in spans]
+
+
+def _section_titles(paragraphs: List[str]) -> List[str]:
+    """Title of the "Title:" section each paragraph belongs to ("" before the first one)."""
+    titles: List[str] = []
+    current = ""
+    for p in paragraphs:
+        first = p.splitlines()[0].strip()
+        if first.lower().startswith("title:"):
+            current = first.split(":", 1)[1].strip()
+        titles.append(current)
+    return titles
+
+
+def _estimate_tokens(text: Union[str, int]) -> int:
+    """Rough token count for a string, or for a number of characters."""
+    n = text if isinstance(text, int) else len(text)
+    return (n + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _merge_span(spans: List[Tuple[int, int]], start: int, end: int) -> Tuple[List[Tuple[int, int]], int]:
+    """Add [start, end) to a sorted list of disjoint spans; return the new list and how many chars were new."""
+    covered = sum(max(0, min(end, e) - max(start, s)) for s, e in spans)
+    merged: List[Tuple[int, int]] = []
+    for s, e in sorted(spans + [(start, end)]):
+        if merged and s <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+    return merged, (end - start) - covered
+
+
+def pack_context(
+    index: KBIndex,
+    chunks: List[str],
+    budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+    max_chunks: int = CONTEXT_MAX_CHUNKS,
+) -> str:
+    """Build the prompt context from the top `max_chunks` ranked chunks (most relevant first).
+
+    Overlapping windows of the same paragraph are merged so shared text appears once,
+    chunks from the same "Title:" section are grouped under one heading in document
+    order, and chunks are added in relevance order until the token budget is spent.
+    The most relevant chunk is always included. Chunks unknown to `index` (e.g. from a
+    snapshot that has since been replaced) are used as-is.
+    """
+    chunks = chunks[:max_chunks]
+    selected: Dict[int, List[Tuple[int, int]]] = {}
+    loose: List[str] = []
+    section_order: List[str] = []
+    used = 0
+    for chunk in chunks:
+        pos = index.position.get(chunk)
+        if pos is None:
+            cost = _estimate_tokens(chunk)
+            if (loose or selected) and used + cost > budget_tokens:
+                continue
+            loose.append(chunk)
+            used += cost
+            continue
+        para, start, end = index.spans[pos]
+        merged, new_chars = _merge_span(selected.get(para, []), start, end)
+        if new_chars <= 0:
+            continue
+        cost = _estimate_tokens(new_chars)
+        if (loose or selected) and used + cost > budget_tokens:
+            continue
+        selected[para] = merged
+        used += cost
+        if index.sections[para] not in section_order:
+            section_order.append(index.sections[para])
+
+    blocks: List[str] = []
+    for section in section_order:
+        pieces: List[str] = []
+        for para in sorted(p for p in selected if index.sections[p] == section):
+            text = index.paragraphs[para]
+            for start, end in selected[para]:
+                piece = _clean_chunk_text(text[start:end])
+                if section and piece.startswith(section):
+                    piece = piece[len(section):].strip()
+                if piece:
+                    pieces.append(piece)
+        body = " ... ".join(pieces)
+        blocks.append(f"{section}\n{body}" if section else body)
+    blocks.extend(_clean_chunk_text(c) for c in loose)
+    return "\n\n".join(b for b in blocks if b)
 
 
 def _clean_chunk_text(s: str) -> str:
@@ -166,63 +381,152 @@ def _clean_chunk_text(s: str) -> str:
 
 
 async def load_nlp_resources() -> None:
-    """Load embedding model, Gemini client and build an in-memory vector index from knowledge_base.txt."""
-    global _embed_model, _kb_chunks, _kb_embeddings, _gemini_client
+    """Load embedding model, Gemini client and build an in-memory vector index from knowledge_base.txt.
+
+    The model and client are created once per process; later calls only rebuild the index.
+    """
+    global _embed_model, _gemini_client
     
-    print("Loading embedding model...")
-    # Sentence-BERT model for semantic similarity
-    _embed_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    if _embed_model is None:
+        print("Loading embedding model...")
+        # Sentence-BERT model for semantic similarity
+        _embed_model = await asyncio.to_thread(SentenceTransformer, "sentence-transformers/all-MiniLM-L6-v2")
+        clear_embedding_cache()
 
-    print("Initializing Gemini client...")
-    # Initialize Gemini client - API key should be in GEMINI_API_KEY environment variable
-    try:
-        _gemini_client = genai.Client()
-        print("Gemini client initialized successfully!")
-    except Exception as e:
-        print(f"Failed to initialize Gemini client: {e}")
-        print("Make sure GEMINI_API_KEY environment variable is set")
-        _gemini_client = None
-
-    print("Building knowledge base index...")
-    # Build KB index from file
-    kb_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "knowledge_base.txt")
-    kb_text = _read_knowledge_base(kb_path)
-    if not kb_text:
-        _kb_chunks = []
-        _kb_embeddings = None
+    if _gemini_client is None:
+        print("Initializing Gemini client...")
+        # Initialize Gemini client - API key should be in GEMINI_API_KEY environment variable
+        try:
+            _gemini_client = genai.Client()
+            print("Gemini client initialized successfully!")
+        except Exception as e:
+            print(f"Failed to initialize Gemini client: {e}")
+            print("Make sure GEMINI_API_KEY environment variable is set")
+            _gemini_client = None
+
+    await reindex_knowledge_base()
+    print("NLP resources loaded successfully!")
+
+
+def _build_index(path: str) -> KBIndex:
+    kb_text = _read_knowledge_base(path)
+    version = hashlib.sha1(kb_text.encode("utf-8")).hexdigest()[:12] if kb_text else ""
+    paragraphs, spans = _chunk_spans(kb_text, chunk_size=1000, overlap=200)
+    chunks = tuple(paragraphs[p][start:end] for p, start, end in spans)
+    if not chunks:
+        return KBIndex((), None, version)
+    embeddings = _embed_model.encode(list(chunks), convert_to_tensor=True, normalize_embeddings=True)
+    return KBIndex(chunks, embeddings, version, tuple(paragraphs), tuple(_section_titles(paragraphs)), tuple(spans))
+
+
+async def reindex_knowledge_base(path: Optional[str] = None) -> KBIndex:
+    """Rebuild the KB index in a worker thread and publish it with a single reference swap.
+
+    Queries keep being served from the previous snapshot until the swap; rebuilds are
+    serialized so two concurrent reindexes cannot publish out of order.
+    """
+    global _index
+    async with _index_lock:
+        print("Building knowledge base index...")
+        new_index = await asyncio.to_thread(_build_index, path or KNOWLEDGE_BASE_PATH)
+        if _precomputed[3] != new_index.version:
+            # Precomputed answers were generated against a different KB
+            clear_precomputed_answers()
+        _index = new_index
+        return new_index
+
+
+def get_index() -> KBIndex:
+    """Current KB snapshot. Hold on to the returned object for the duration of a query."""
+    return _index
+
+
+def get_kb_version() -> str:
+    """Short content hash of the currently indexed knowledge base ("" if empty)."""
+    return _index.version
+
+
+def set_precomputed_answers(questions: List[str], answers: List[str], kb_version: str) -> None:
+    """Install a precomputed answer table, replacing the previous one in a single assignment."""
+    global _precomputed
+    if not questions or _embed_model is None:
+        _precomputed = ([], [], None, kb_version)
         return
+    embeddings = _embed_model.encode(questions, convert_to_tensor=True, normalize_embeddings=True)
+    _precomputed = (list(questions), list(answers), embeddings, kb_version)
+
+
+def clear_precomputed_answers() -> None:
+    global _precomputed
+    _precomputed = ([], [], None, "")
+
+
+def _lookup_precomputed(query_emb, index: Optional[KBIndex] = None) -> Optional[Tuple[str, str, float]]:
+    """Nearest precomputed question for the query, if close enough and built for the KB of `index`."""
+    questions, answers, embeddings, kb_version = _precomputed
+    if index is None:
+        index = _index
+    if not questions or embeddings is None or kb_version != index.version:
+        return None
+    scores = util.cos_sim(query_emb, embeddings)[0]
+    best_idx = int(scores.argmax())
+    best_score = float(scores[best_idx])
+    if best_score < PRECOMPUTED_MATCH_THRESHOLD:
+        return None
+    return questions[best_idx], answers[best_idx], best_score
+
+
+def _search_embeddings(index: KBIndex, query_embs, top_k: int) -> List[List[Tuple[str, float]]]:
+    """Top-k chunks of `index` for each row of `query_embs` with a single similarity matmul."""
+    if not index:
+        return [[] for _ in range(len(query_embs))]
+    scores = util.cos_sim(query_embs, index.embeddings)
+    vals, idxs = scores.topk(min(top_k, len(index.chunks)), dim=1)
+    return [
+        [(index.chunks[int(i)], float(v)) for v, i in zip(row_vals, row_idxs)]
+        for row_vals, row_idxs in zip(vals.tolist(), idxs.tolist())
+    ]
 
-    _kb_chunks = _chunk_text(kb_text, chunk_size=1000, overlap=200)
-    if _kb_chunks:
-        _kb_embeddings = _embed_model.encode(_kb_chunks, convert_to_tensor=True, normalize_embeddings=True)
-    
-    print("NLP resources loaded successfully!")
+
+async def _vector_search(query: Union[str, QueryContext], top_k: int = 3, index: Optional[KBIndex] = None) -> List[Tuple[str, float]]:
+    """Return top_k matching KB chunks and their similarity scores, from `index` or the live snapshot."""
+    if index is None:
+        index = _index
+    if not index or _embed_model is None:
+        return []
+    q = _as_query(query)
+    return _search_embeddings(index, q.embedding.unsqueeze(0), top_k)[0]
 
 
-async def _vector_search(query: str, top_k: int = 3) -> List[Tuple[str, float]]:
-    """Return top_k matching KB chunks and their similarity scores."""
-    global _embed_model, _kb_chunks, _kb_embeddings
-    if not _kb_chunks or _embed_model is None or _kb_embeddings is None:
+def _vector_search_batch_sync(
+    queries: List[QueryContext], top_k: int, index: Optional[KBIndex] = None
+) -> List[List[Tuple[str, float]]]:
+    if not queries:
         return []
-    query_emb = _embed_model.encode(query, convert_to_tensor=True, normalize_embeddings=True)
-    scores = util.cos_sim(query_emb, _kb_embeddings)[0]
-    vals, idxs = scores.topk(min(top_k, len(_kb_chunks)))
-    results: List[Tuple[str, float]] = []
-    for v, i in zip(vals, idxs):
-        results.append((_kb_chunks[int(i)], float(v)))
-    return results
+    if index is None:
+        index = _index
+    if not index or _embed_model is None:
+        return [[] for _ in queries]
+    query_embs = _encode_cached([q.normalized for q in queries])
+    for q, emb in zip(queries, query_embs):
+        q._embedding = emb
+    # One (n_queries x n_chunks) similarity matrix for the whole batch
+    return _search_embeddings(index, query_embs, top_k)
 
 
-async def run_gemini_generation(user_query: str, context: str) -> str:
-    """Generate response using Gemini API with proper prompting."""
-    global _gemini_client
-    
-    if _gemini_client is None:
-        return ""
-    
-    try:
-        # Create a comprehensive prompt for the DoJ chatbot
-        prompt = f"""You are an official Department of Justice (India) chatbot assistant. Your role is to help Indian citizens with legal queries, court procedures, and government services.
+async def _vector_search_batch(
+    queries: List[Union[str, QueryContext]], top_k: int = 3, index: Optional[KBIndex] = None
+) -> List[List[Tuple[str, float]]]:
+    """Batched variant of _vector_search: one encode call and one similarity matmul for all queries.
+
+    Runs in a worker thread so large batches do not stall the event loop.
+    """
+    return await asyncio.to_thread(_vector_search_batch_sync, [_as_query(q) for q in queries], top_k, index)
+
+
+# The instruction preamble and generation config are static; build them once. Keeping the
+# preamble byte-identical across requests also gives Gemini a stable prefix to cache.
+_PROMPT_PREAMBLE = """You are an official Department of Justice (India) chatbot assistant. Your role is to help Indian citizens with legal queries, court procedures, and government services.
 
 Based on the provided context, answer the user's question in a helpful, accurate, and citizen-friendly manner. Follow these guidelines:
 
@@ -237,22 +541,37 @@ Based on the provided context, answer the user's question in a helpful, accurate
 9. If user is asking follow-up questions about legal processes, assume they want detailed procedural guidance
 
 Context from Knowledge Base:
-{context}
+"""
 
-User Question: {user_query}
+_PROMPT_SUFFIX = """
 
 Important: If the user is asking about "process", "procedure", "how to file", "guide me", or similar procedural questions, provide detailed step-by-step instructions from the context. Don't give generic responses - give specific, actionable steps they can follow."""
 
+_GENERATION_CONFIG = types.GenerateContentConfig(
+    thinking_config=types.ThinkingConfig(thinking_budget=0),  # Disable thinking for speed
+    temperature=0.7,
+    max_output_tokens=300,  # Keep responses concise
+    top_p=0.9
+)
+
+
+def build_prompt(user_query: str, context: str) -> str:
+    return "".join((_PROMPT_PREAMBLE, context, "\n\nUser Question: ", user_query, _PROMPT_SUFFIX))
+
+
+async def run_gemini_generation(user_query: str, context: str) -> str:
+    """Generate response using Gemini API with proper prompting."""
+    global _gemini_client
+    
+    if _gemini_client is None:
+        return ""
+    
+    try:
         # Generate response with thinking disabled for faster response
-        response = _gemini_client.models.generate_content(
+        response = await _gemini_client.aio.models.generate_content(
             model="gemini-2.5-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=0),  # Disable thinking for speed
-                temperature=0.7,
-                max_output_tokens=300,  # Keep responses concise
-                top_p=0.9
-            )
+            contents=build_prompt(user_query, context),
+            config=_GENERATION_CONFIG,
         )
         
         if response and response.text:
@@ -268,14 +587,15 @@ Important: If the user is asking about "process", "procedure", "how to file", "g
         return ""
 
 
-def _get_fallback_response(user_query: str) -> str:
+def _get_fallback_response(user_query: Union[str, QueryContext]) -> str:
     """Return appropriate fallback response for out-of-scope queries."""
+    query_lower = _as_query(user_query).normalized
     greetings = ["hello", "hi", "hey", "good morning", "good evening", "namaste"]
-    if any(greeting in user_query.lower() for greeting in greetings):
+    if any(greeting in query_lower for greeting in greetings):
         return "Hello! I'm here to help you with legal and justice-related queries. How can I assist you with court services, legal procedures, or government services today?"
     
     bot_questions = ["what is your name", "who are you", "what are you", "your name"]
-    if any(question in user_query.lower() for question in bot_questions):
+    if any(question in query_lower for question in bot_questions):
         return "I'm the Department of Justice chatbot, designed to help citizens with legal queries, court procedures, and government services. How can I assist you with legal matters today?"
     
     return ("I'm designed to help with legal and justice-related queries. I can assist you with:\n"
@@ -287,35 +607,18 @@ def _get_fallback_response(user_query: str) -> str:
             "Please ask me about any legal or government service you need help with.")
 
 
-async def generate_bot_response(user_query: str, db) -> str:
-    """Generate bot response with confidence threshold and out-of-scope detection."""
-    
-    # Step 1: Check if query is legal-related
-    if not _is_legal_query(user_query):
-        return _get_fallback_response(user_query)
-    
-    # Step 2: Vector search in knowledge_base.txt
-    matches = await _vector_search(user_query, top_k=5)
-    if not matches:
-        return _get_fallback_response(user_query)
-
-    # Step 3: Check confidence threshold on the best match
-    best_score = matches[0][1]
-    if best_score < MIN_CONFIDENCE_THRESHOLD:
-        return _get_fallback_response(user_query)
+def _rank_matches(q: QueryContext, matches: List[Tuple[str, float]]) -> List[Tuple[str, float, str, float]]:
+    """Re-rank vector matches with lexical overlap and intent boosts.
 
-    # Step 4: Filter and rank chunks
+    Returns (chunk, score, cleaned chunk, composite) tuples, best first.
+    """
     filtered: List[Tuple[str, float, str]] = []
     for chunk, score in matches:
         cleaned = _clean_chunk_text(chunk)
         if len(cleaned.split()) >= 3:
             filtered.append((chunk, score, cleaned))
     
-    def _token_set(s: str) -> set:
-        toks = [t.lower() for t in re.split(r"\W+", s) if len(t) > 2]
-        return set(toks)
-
-    q_tokens = _token_set(user_query)
+    q_tokens = q.tokens
     ranked: List[Tuple[str, float, str, float]] = []
     
     for chunk, score, cleaned in filtered:
@@ -327,36 +630,103 @@ async def generate_bot_response(user_query: str, db) -> str:
         
         # Boost for URL-related queries
         url_boost = 0.0
-        if any(word in user_query.lower() for word in ["url", "link", "website", "portal", "tell me the"]):
+        if q.wants_url:
             if any(word in cleaned.lower() for word in ["http", "www", ".gov", ".in", ".com", "portal"]):
                 url_boost = 0.3
         
         # Boost for exact keyword matches
         keyword_boost = 0.0
-        important_keywords = {"cyber", "crime", "consumer", "complaint", "aadhaar", "licence", "legal", "aid"}
-        if q_tokens & important_keywords:
-            if chunk_tokens & important_keywords:
+        if q_tokens & IMPORTANT_KEYWORDS:
+            if chunk_tokens & IMPORTANT_KEYWORDS:
                 keyword_boost = 0.2
         
         composite = 0.6 * score + 0.2 * overlap_frac + url_boost + keyword_boost
         ranked.append((chunk, score, cleaned, composite))
 
     ranked.sort(key=lambda x: x[3], reverse=True)
+    return ranked
+
+
+async def generate_bot_response(user_query: Union[str, QueryContext], db, use_llm: bool = True) -> str:
+    """Generate bot response with confidence threshold and out-of-scope detection.
+
+    With `use_llm=False` Gemini is skipped and the extractive answer is returned
+    (used when the server is shedding load).
+    """
+    text, _ = await generate_bot_response_traced(user_query, db, use_llm=use_llm)
+    return text
+
+
+async def generate_bot_response_traced(
+    user_query: Union[str, QueryContext],
+    db,
+    matches: Optional[List[Tuple[str, float]]] = None,
+    use_precomputed: bool = True,
+    use_llm: bool = True,
+    index: Optional[KBIndex] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """Same pipeline as generate_bot_response, but also returns a trace of the branch taken.
+
+    `matches` may be supplied by callers that already ran the vector search (e.g. the
+    batch path), in which case the search step is skipped; pass the `index` snapshot
+    they were taken from so context packing reads the same one. `db` may be None to skip
+    the legacy FAQ lookup. `use_precomputed=False` bypasses the precomputed answer table
+    (used when building that table).
+    """
+    q = _as_query(user_query)
+    if index is None:
+        index = _index  # one snapshot for search and context packing
+    trace: Dict[str, Any] = {"branch": "", "best_score": None, "best_composite": None, "matches": []}
+
+    def _done(branch: str, text: str) -> Tuple[str, Dict[str, Any]]:
+        trace["branch"] = branch
+        return text, trace
+
+    # Step 1: Check if query is legal-related
+    if not _is_legal_query(q):
+        return _done("out_of_scope", _get_fallback_response(q))
+    
+    # Step 2: Precomputed answer for a frequently asked question
+    if use_precomputed and _precomputed[0] and _embed_model is not None:
+        hit = _lookup_precomputed(q.embedding, index)
+        if hit is not None:
+            trace["precomputed_question"], answer, trace["precomputed_score"] = hit
+            return _done("precomputed", answer)
+
+    # Step 3: Vector search in knowledge_base.txt
+    if matches is None:
+        matches = await _vector_search(q, top_k=5, index=index)
+    if not matches:
+        return _done("no_matches", _get_fallback_response(q))
+
+    # Step 4: Check confidence threshold on the best match
+    best_score = matches[0][1]
+    trace["best_score"] = best_score
+    trace["matches"] = [{"score": score} for _, score in matches]
+    if best_score < MIN_CONFIDENCE_THRESHOLD:
+        return _done("low_confidence", _get_fallback_response(q))
+
+    # Step 5: Filter and rank chunks
+    ranked = _rank_matches(q, matches)
+    trace["matches"] = [{"score": r[1], "composite": r[3]} for r in ranked]
+    if ranked:
+        trace["best_composite"] = ranked[0][3]
 
     if not ranked or ranked[0][3] < MIN_COMPOSITE_THRESHOLD:
-        return _get_fallback_response(user_query)
+        return _done("low_composite", _get_fallback_response(q))
 
-    # Step 5: Try Gemini generation with the best context(s)
+    # Step 6: Try Gemini generation with the best context(s)
     if ranked:
-        # Use top 2 chunks for better context
-        top_contexts = [chunk[2] for chunk in ranked[:2]]
-        combined_context = "\n\n".join(top_contexts)
+        # Pack relevant chunks, deduplicated and grouped by section, up to the token budget
+        relevant = [r[0] for r in ranked if r[3] >= MIN_COMPOSITE_THRESHOLD]
+        combined_context = pack_context(index, relevant)
+        trace["context_tokens"] = _estimate_tokens(combined_context)
         
         # Try Gemini API first
-        if _gemini_client is not None:
-            gemini_response = await run_gemini_generation(user_query, combined_context)
+        if use_llm and _gemini_client is not None:
+            gemini_response = await run_gemini_generation(q.text, combined_context)
             if gemini_response and len(gemini_response.split()) >= 5:
-                return gemini_response
+                return _done("gemini", gemini_response)
 
         # Fallback to returning cleaned context if Gemini fails
         top_cleaned = ranked[0][2]
@@ -369,27 +739,74 @@ async def generate_bot_response(user_query: str, db) -> str:
                 # Return first 2-3 sentences that contain useful information
                 result = " ".join(good_sents[:3]).strip()
                 if len(result) > 20:  # Ensure it's substantial
-                    return result[:800]
-
-    # Step 6: Fallback to DB-stored FAQs (legacy support)
-    try:
-        fetched: List[Tuple[str, str]] = []
-        async for doc in db.faqs.find({}):
-            fetched.append((doc.get("question", ""), doc.get("answer", "")))
-        if fetched and _embed_model is not None:
-            qs = [q for q, _ in fetched]
-            q_embs = _embed_model.encode(qs, convert_to_tensor=True, normalize_embeddings=True)
-            query_emb = _embed_model.encode(user_query, convert_to_tensor=True, normalize_embeddings=True)
-            scores = util.cos_sim(query_emb, q_embs)[0]
-            best_idx = int(scores.argmax())
-            best_score = float(scores[best_idx])
-            if best_score >= 0.40:
-                return fetched[best_idx][1]
-    except Exception:
-        pass
+                    return _done("extractive", result[:800])
+
+    # Step 7: Fallback to DB-stored FAQs (legacy support)
+    if db is not None:
+        try:
+            fetched: List[Tuple[str, str]] = []
+            async for doc in db.faqs.find({}):
+                fetched.append((doc.get("question", ""), doc.get("answer", "")))
+            if fetched and _embed_model is not None:
+                # FAQ questions go through the same LRU, so only new/changed FAQs hit the model
+                q_embs = _encode_cached([" ".join(question.lower().split()) for question, _ in fetched])
+                scores = util.cos_sim(q.embedding, q_embs)[0]
+                best_idx = int(scores.argmax())
+                best_score = float(scores[best_idx])
+                if best_score >= 0.40:
+                    return _done("faq", fetched[best_idx][1])
+        except Exception:
+            pass
 
     # Final fallback
-    return _get_fallback_response(user_query)
+    return _done("fallback", _get_fallback_response(q))
+
+
+async def answer_questions_batch(
+    questions: List[str],
+    db=None,
+    top_k: int = 5,
+    batch_size: int = 64,
+    concurrency: int = 8,
+    use_precomputed: bool = True,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Answer many questions without touching db.messages.
+
+    Questions are embedded and searched `batch_size` at a time (one encode call and one
+    similarity matmul per batch); the per-question pipeline, including the Gemini call,
+    runs concurrently with at most `concurrency` questions in flight. Results are yielded
+    as they complete, each tagged with its position in `questions`.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def _answer_one(
+        position: int, question: QueryContext, matches: List[Tuple[str, float]], kb: KBIndex
+    ) -> Dict[str, Any]:
+        async with sem:
+            try:
+                text, trace = await generate_bot_response_traced(
+                    question, db, matches=matches, use_precomputed=use_precomputed, index=kb
+                )
+            except Exception as e:
+                return {"index": position, "question": question.text, "answer": "", "branch": "error", "error": str(e)}
+        return {"index": position, "question": question.text, "answer": text, **trace}
+
+    for start in range(0, len(questions), max(1, batch_size)):
+        batch = [QueryContext(q) for q in questions[start:start + batch_size]]
+        # Search and answer the whole batch against one snapshot, even if a reindex lands meanwhile
+        kb = _index
+        all_matches = await _vector_search_batch(batch, top_k=top_k, index=kb)
+        tasks = [
+            asyncio.create_task(_answer_one(start + offset, q, m, kb))
+            for offset, (q, m) in enumerate(zip(batch, all_matches))
+        ]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+        finally:
+            # Consumer went away (e.g. client disconnected) - don't leave work running
+            for t in tasks:
+                t.cancel()
 
 
 async def seed_default_faqs(db) -> None:
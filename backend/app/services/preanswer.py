@@ -0,0 +1,247 @@
+"""Pre-answering of the most frequent questions mined from chat history.
+
+A scheduled job clusters recent user questions from db.messages by embedding
+similarity, generates answers for the top-K clusters against the current KB and
+installs them as nlp's precomputed answer table, which generate_bot_response
+checks before running retrieval and Gemini. The table is persisted in
+db.precomputed_answers (tagged with the KB version) and rebuilt after a reindex.
+
+With several workers only the one holding the "preanswer" lease rebuilds; the
+others load the persisted table once it is done.
+"""
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import leases, nlp
+
+
+PREANSWER_TOP_K = int(os.getenv("PREANSWER_TOP_K", "200"))
+PREANSWER_WINDOW_DAYS = int(os.getenv("PREANSWER_WINDOW_DAYS", "1"))
+# Hour of day (UTC) for the nightly run; empty disables the scheduler
+PREANSWER_HOUR = os.getenv("PREANSWER_HOUR", "2")
+# Same threshold the lookup uses, so a cluster's count is the traffic its entry actually serves
+CLUSTER_SIMILARITY = nlp.PRECOMPUTED_MATCH_THRESHOLD
+# Upper bound on a rebuild (one Gemini call per cluster); a crashed runner's lease expires after this
+PREANSWER_LEASE_SECONDS = int(os.getenv("PREANSWER_LEASE_SECONDS", "3600"))
+LEASE_NAME = "preanswer"
+LEASE_POLL_SECONDS = 30
+# Only answers grounded in the KB are worth caching; fallbacks are already cheap
+CACHEABLE_BRANCHES = {"gemini", "extractive"}
+
+_rebuild_lock = asyncio.Lock()
+_last_report: Optional[Dict[str, Any]] = None
+_scheduler_task: Optional[asyncio.Task] = None
+_background: set = set()  # strong refs so fire-and-forget rebuilds aren't garbage collected
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def cluster_questions(questions: List[str], threshold: float = CLUSTER_SIMILARITY) -> List[Tuple[str, int]]:
+    """Greedy leader clustering of questions by embedding similarity.
+
+    Returns (representative, count) pairs sorted by count. Exact duplicates are
+    collapsed first, and phrasings are visited most-frequent first so each
+    cluster is represented by its most common wording. Blocking.
+    """
+    counts: Counter = Counter()
+    originals: Dict[str, str] = {}
+    for q in questions:
+        key = _normalize(q)
+        if not key:
+            continue
+        counts[key] += 1
+        originals.setdefault(key, q.strip())
+    if not counts or nlp._embed_model is None:
+        return []
+
+    keys = [k for k, _ in counts.most_common()]
+    embeddings = nlp._embed_model.encode(keys, convert_to_tensor=True, normalize_embeddings=True)
+    leaders: List[int] = []
+    cluster_counts: List[int] = []
+    # Leader embeddings live in a buffer that doubles when full, so each step compares
+    # against a view instead of gathering a fresh leader matrix
+    leader_embs = embeddings.new_empty((min(len(keys), 1024), embeddings.shape[1]))
+    for i in range(len(keys)):
+        if leaders:
+            sims = leader_embs[: len(leaders)] @ embeddings[i]
+            j = int(sims.argmax())
+            if float(sims[j]) >= threshold:
+                cluster_counts[j] += counts[keys[i]]
+                continue
+        if len(leaders) == leader_embs.shape[0]:
+            grown = embeddings.new_empty((min(len(keys), 2 * len(leaders)), embeddings.shape[1]))
+            grown[: len(leaders)] = leader_embs
+            leader_embs = grown
+        leader_embs[len(leaders)] = embeddings[i]
+        leaders.append(i)
+        cluster_counts.append(counts[keys[i]])
+
+    clusters = [(originals[keys[i]], c) for i, c in zip(leaders, cluster_counts)]
+    clusters.sort(key=lambda x: x[1], reverse=True)
+    return clusters
+
+
+async def rebuild_precomputed_answers(db, top_k: int = PREANSWER_TOP_K, window_days: int = PREANSWER_WINDOW_DAYS) -> Dict[str, Any]:
+    """Mine db.messages, pre-generate answers for the top-K question clusters and install them.
+
+    Returns a report including the share of user questions in the window covered
+    by the precomputed table. If another worker holds the rebuild lease nothing is
+    done and the report has "skipped" set.
+    """
+    async with _rebuild_lock:
+        async with leases.job_lease(db, LEASE_NAME, PREANSWER_LEASE_SECONDS) as acquired:
+            if not acquired:
+                return {"skipped": True, "reason": "rebuild running in another worker"}
+            return await _rebuild(db, top_k, window_days)
+
+
+async def _rebuild(db, top_k: int, window_days: int) -> Dict[str, Any]:
+    global _last_report
+    started = datetime.now(tz=timezone.utc)
+    since = started - timedelta(days=window_days)
+    questions: List[str] = []
+    async for doc in db.messages.find({"sender": "user", "timestamp": {"$gte": since}}, {"text": 1}):
+        questions.append(doc.get("text", ""))
+
+    clusters = await asyncio.to_thread(cluster_questions, questions)
+    top = clusters[:top_k]
+    kb_version = nlp.get_kb_version()
+
+    answers: Dict[int, Dict[str, Any]] = {}
+    async for result in nlp.answer_questions_batch([q for q, _ in top], use_precomputed=False):
+        answers[result["index"]] = result
+
+    entries = []
+    covered = 0
+    for i, (question, count) in enumerate(top):
+        result = answers.get(i)
+        if result and result.get("branch") in CACHEABLE_BRANCHES and result.get("answer"):
+            entries.append({
+                "question": question,
+                "answer": result["answer"],
+                "count": count,
+                "kbVersion": kb_version,
+                "createdAt": started,
+            })
+            covered += count
+
+    report: Dict[str, Any] = {
+        "startedAt": started,
+        "windowDays": window_days,
+        "kbVersion": kb_version,
+        "totalQuestions": len(questions),
+        "clusters": len(clusters),
+        "precomputed": len(entries),
+        "coveredQuestions": covered,
+        "coverage": covered / len(questions) if questions else 0.0,
+    }
+
+    if nlp.get_kb_version() != kb_version:
+        # KB was reindexed while we were generating; these answers are stale
+        report["discarded"] = True
+    else:
+        await asyncio.to_thread(
+            nlp.set_precomputed_answers,
+            [e["question"] for e in entries],
+            [e["answer"] for e in entries],
+            kb_version,
+        )
+        await _replace_table(db, entries)
+    await db.preanswer_runs.insert_one(dict(report))
+    _last_report = report
+    print(f"Pre-answered {len(entries)} questions covering {report['coverage']:.1%} of traffic")
+    return report
+
+
+async def _replace_table(db, entries: List[Dict[str, Any]]) -> None:
+    """Swap in the new table in one step, so readers never see it half-written."""
+    if not entries:
+        await db.precomputed_answers.delete_many({})
+        return
+    staging = db[f"precomputed_answers_staging_{leases.OWNER_ID.rsplit(':', 1)[-1]}"]
+    await staging.drop()
+    await staging.insert_many(entries)
+    await staging.rename("precomputed_answers", dropTarget=True)
+
+
+async def load_precomputed_answers(db) -> int:
+    """Install the persisted table if it was built for the currently indexed KB."""
+    kb_version = nlp.get_kb_version()
+    questions: List[str] = []
+    answers: List[str] = []
+    async for doc in db.precomputed_answers.find({"kbVersion": kb_version}):
+        questions.append(doc.get("question", ""))
+        answers.append(doc.get("answer", ""))
+    if questions:
+        await asyncio.to_thread(nlp.set_precomputed_answers, questions, answers, kb_version)
+    return len(questions)
+
+
+async def _wait_and_load(db) -> int:
+    """Wait for the worker holding the lease to finish, then install the table it persisted."""
+    while await leases.lease_held(db, LEASE_NAME):
+        await asyncio.sleep(LEASE_POLL_SECONDS)
+    return await load_precomputed_answers(db)
+
+
+async def _rebuild_logged(db, reuse_persisted: bool = False) -> None:
+    try:
+        if reuse_persisted and await load_precomputed_answers(db):
+            # Another worker already built the table for this KB version
+            return
+        report = await rebuild_precomputed_answers(db)
+        if report.get("skipped"):
+            await _wait_and_load(db)
+    except Exception as e:
+        print(f"Pre-answer rebuild failed: {e}")
+
+
+def schedule_rebuild(db) -> asyncio.Task:
+    """Start a rebuild in the background (e.g. after /admin/reindex or a KB file change).
+
+    Every worker that reindexed calls this. The one holding the lease rebuilds;
+    the rest wait for it and load its table, or reuse one already persisted for
+    the new KB version.
+    """
+    task = asyncio.create_task(_rebuild_logged(db, reuse_persisted=True))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+def get_last_report() -> Optional[Dict[str, Any]]:
+    return _last_report
+
+
+def _seconds_until(hour: int) -> float:
+    now = datetime.now(tz=timezone.utc)
+    next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+async def _run_nightly(db, hour: int) -> None:
+    while True:
+        await asyncio.sleep(_seconds_until(hour))
+        await _rebuild_logged(db)
+
+
+def start_scheduler(db) -> None:
+    """Start the nightly job if PREANSWER_HOUR is set."""
+    global _scheduler_task
+    if not PREANSWER_HOUR or _scheduler_task is not None:
+        return
+    _scheduler_task = asyncio.create_task(_run_nightly(db, int(PREANSWER_HOUR) % 24))
+
+
+def stop_scheduler() -> None:
+    global _scheduler_task
+    if _scheduler_task is not None:
+        _scheduler_task.cancel()
+        _scheduler_task = None
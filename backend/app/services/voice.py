@@ -0,0 +1,281 @@
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import wave
+from array import array
+from typing import Iterator, List, Optional, Tuple
+
+
+# Audio format expected on the wire: mono, 16-bit little-endian PCM
+DEFAULT_SAMPLE_RATE = 16000
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 22050, 44100, 48000)
+SAMPLE_WIDTH = 2
+
+# Voice-activity detection defaults (energy based)
+VAD_FRAME_MS = 30
+VAD_ENERGY_THRESHOLD = float(os.getenv("VOICE_VAD_THRESHOLD", "500"))
+VAD_START_FRAMES = 3       # consecutive voiced frames before an utterance starts
+VAD_HANGOVER_MS = 800      # trailing silence that ends an utterance
+VAD_PREROLL_MS = 300       # audio kept from before the start so first syllable isn't clipped
+
+
+def _primary_language(tag: str) -> str:
+    # "en-US" / "en_IN" / "EN" -> "en"
+    return re.split(r"[-_]", tag.strip().lower(), 1)[0]
+
+
+class STTSession:
+    """Incremental recognizer for a single utterance. Methods are blocking."""
+
+    def accept(self, pcm: bytes) -> Optional[str]:
+        """Feed audio; return the current partial transcript if it changed."""
+        raise NotImplementedError
+
+    def finish(self) -> str:
+        """Return the final transcript for the utterance."""
+        raise NotImplementedError
+
+
+class STTBackend:
+    def supports(self, language: str) -> bool:
+        return True
+
+    def new_session(self, sample_rate: int, language: str) -> STTSession:
+        raise NotImplementedError
+
+
+class TTSBackend:
+    def synthesize(self, text: str) -> bytes:
+        """Return WAV bytes for `text`. Blocking."""
+        raise NotImplementedError
+
+
+class _VoskSession(STTSession):
+    def __init__(self, recognizer) -> None:
+        self._rec = recognizer
+        self._last_partial = ""
+        self._final_parts: List[str] = []
+
+    def accept(self, pcm: bytes) -> Optional[str]:
+        if self._rec.AcceptWaveform(pcm):
+            # Vosk detected an internal segment boundary; keep it and keep going
+            text = json.loads(self._rec.Result()).get("text", "")
+            if text:
+                self._final_parts.append(text)
+        partial = json.loads(self._rec.PartialResult()).get("partial", "")
+        current = " ".join(self._final_parts + ([partial] if partial else []))
+        if current != self._last_partial:
+            self._last_partial = current
+            return current
+        return None
+
+    def finish(self) -> str:
+        text = json.loads(self._rec.FinalResult()).get("text", "")
+        if text:
+            self._final_parts.append(text)
+        return " ".join(self._final_parts).strip()
+
+
+class VoskSTTBackend(STTBackend):
+    """Offline STT using Vosk. The model directory comes from VOSK_MODEL_PATH.
+
+    A Vosk model covers a single language, given by VOSK_MODEL_LANGUAGE (default "en");
+    sessions for any other language are refused rather than silently transcribed as English.
+    """
+
+    def __init__(self, model_path: Optional[str] = None, language: Optional[str] = None) -> None:
+        from vosk import Model  # imported lazily; optional dependency
+
+        path = model_path or os.getenv("VOSK_MODEL_PATH")
+        if not path:
+            raise RuntimeError("VOSK_MODEL_PATH is not set")
+        self._language = _primary_language(language or os.getenv("VOSK_MODEL_LANGUAGE", "en"))
+        self._model = Model(path)
+
+    def supports(self, language: str) -> bool:
+        return _primary_language(language) == self._language
+
+    def new_session(self, sample_rate: int, language: str) -> STTSession:
+        from vosk import KaldiRecognizer
+
+        if not self.supports(language):
+            raise ValueError(f"Vosk model is for {self._language!r}, not {language!r}")
+
+        return _VoskSession(KaldiRecognizer(self._model, sample_rate))
+
+
+class _FakeSession(STTSession):
+    def __init__(self, transcript: str) -> None:
+        self._transcript = transcript
+        self._bytes = 0
+
+    def accept(self, pcm: bytes) -> Optional[str]:
+        self._bytes += len(pcm)
+        return None
+
+    def finish(self) -> str:
+        return self._transcript if self._bytes else ""
+
+
+class FakeSTTBackend(STTBackend):
+    """Returns canned transcripts, one per utterance, cycling through the list."""
+
+    def __init__(self, transcripts: Optional[List[str]] = None) -> None:
+        self._transcripts = transcripts or [os.getenv("VOICE_FAKE_TRANSCRIPT", "how to file a consumer complaint")]
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def new_session(self, sample_rate: int, language: str) -> STTSession:
+        with self._lock:
+            text = self._transcripts[self._next % len(self._transcripts)]
+            self._next += 1
+        return _FakeSession(text)
+
+
+class Pyttsx3TTSBackend(TTSBackend):
+    """Offline TTS via pyttsx3. The engine is not thread-safe, so calls are serialized."""
+
+    def __init__(self, rate: int = 180) -> None:
+        self._rate = rate
+        self._lock = threading.Lock()
+
+    def synthesize(self, text: str) -> bytes:
+        import pyttsx3  # imported lazily; optional dependency
+
+        with self._lock:
+            fd, path = tempfile.mkstemp(suffix=".wav")
+            os.close(fd)
+            try:
+                engine = pyttsx3.init()
+                engine.setProperty("rate", self._rate)
+                engine.save_to_file(text, path)
+                engine.runAndWait()
+                with open(path, "rb") as f:
+                    return f.read()
+            finally:
+                os.remove(path)
+
+
+class FakeTTSBackend(TTSBackend):
+    """Returns a short silent WAV whose length scales with the text."""
+
+    def __init__(self, sample_rate: int = DEFAULT_SAMPLE_RATE) -> None:
+        self._sample_rate = sample_rate
+
+    def synthesize(self, text: str) -> bytes:
+        n_samples = self._sample_rate * max(1, len(text.split())) // 10
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(SAMPLE_WIDTH)
+            w.setframerate(self._sample_rate)
+            w.writeframes(b"\x00\x00" * n_samples)
+        return buf.getvalue()
+
+
+_stt_backend: Optional[STTBackend] = None
+_tts_backend: Optional[TTSBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_stt_backend() -> STTBackend:
+    """Backend chosen by VOICE_STT_BACKEND ("vosk" or "fake"); built once per process.
+
+    Loading a Vosk model takes seconds, so call this from a worker thread.
+    """
+    global _stt_backend
+    with _backend_lock:
+        if _stt_backend is None:
+            name = os.getenv("VOICE_STT_BACKEND", "vosk").lower()
+            _stt_backend = FakeSTTBackend() if name == "fake" else VoskSTTBackend()
+        return _stt_backend
+
+
+def get_tts_backend() -> TTSBackend:
+    """Backend chosen by VOICE_TTS_BACKEND ("pyttsx3" or "fake"); built once per process."""
+    global _tts_backend
+    with _backend_lock:
+        if _tts_backend is None:
+            name = os.getenv("VOICE_TTS_BACKEND", "pyttsx3").lower()
+            _tts_backend = FakeTTSBackend() if name == "fake" else Pyttsx3TTSBackend()
+        return _tts_backend
+
+
+def parse_sample_rate(value) -> Optional[int]:
+    """Return `value` as a supported sample rate, or None if it is not one."""
+    try:
+        rate = int(value)
+    except (TypeError, ValueError):
+        return None
+    return rate if rate in SUPPORTED_SAMPLE_RATES else None
+
+
+def _rms(frame: bytes) -> float:
+    samples = array("h")
+    samples.frombytes(frame[: len(frame) - len(frame) % SAMPLE_WIDTH])
+    if not samples:
+        return 0.0
+    return (sum(s * s for s in samples) / len(samples)) ** 0.5
+
+
+class EnergyVAD:
+    """Frame-energy voice-activity detector.
+
+    `feed` accepts arbitrarily sized PCM chunks and yields events:
+    ("start", b""), ("audio", frame) for every frame inside an utterance
+    (including the pre-roll), and ("end", b"") after enough trailing silence.
+    """
+
+    def __init__(self, sample_rate: int = DEFAULT_SAMPLE_RATE, threshold: float = VAD_ENERGY_THRESHOLD) -> None:
+        self.frame_bytes = sample_rate * VAD_FRAME_MS // 1000 * SAMPLE_WIDTH
+        if self.frame_bytes <= 0:
+            # A zero-sized frame would make feed() loop forever
+            raise ValueError(f"Unsupported sample rate: {sample_rate}")
+        self.threshold = threshold
+        self._hangover_frames = max(1, VAD_HANGOVER_MS // VAD_FRAME_MS)
+        self._preroll_frames = max(1, VAD_PREROLL_MS // VAD_FRAME_MS)
+        self._buf = b""
+        self._preroll: List[bytes] = []
+        self._voiced_run = 0
+        self._silent_run = 0
+        self.in_speech = False
+
+    def feed(self, pcm: bytes) -> Iterator[Tuple[str, bytes]]:
+        self._buf += pcm
+        while len(self._buf) >= self.frame_bytes:
+            frame, self._buf = self._buf[: self.frame_bytes], self._buf[self.frame_bytes:]
+            voiced = _rms(frame) >= self.threshold
+            if not self.in_speech:
+                self._preroll.append(frame)
+                if len(self._preroll) > self._preroll_frames:
+                    self._preroll.pop(0)
+                self._voiced_run = self._voiced_run + 1 if voiced else 0
+                if self._voiced_run >= VAD_START_FRAMES:
+                    self.in_speech = True
+                    self._silent_run = 0
+                    yield "start", b""
+                    for f in self._preroll:
+                        yield "audio", f
+                    self._preroll = []
+                continue
+            yield "audio", frame
+            self._silent_run = 0 if voiced else self._silent_run + 1
+            if self._silent_run >= self._hangover_frames:
+                yield from self.flush()
+
+    def flush(self) -> Iterator[Tuple[str, bytes]]:
+        """Force the end of the current utterance (e.g. client signalled end of speech)."""
+        if self.in_speech:
+            self.in_speech = False
+            self._voiced_run = 0
+            self._silent_run = 0
+            yield "end", b""
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split an answer into sentence-sized pieces so TTS can start before the whole answer is spoken."""
+    parts = re.split(r"(?<=[.!?])\s+|\n+", text)
+    return [p.strip(" •\t") for p in parts if p.strip(" •\t")]
@@ -0,0 +1,60 @@
+"""Answer a file of questions offline and write NDJSON results.
+
+Usage (from backend/):
+    python batch_answer.py questions.txt -o answers.ndjson --concurrency 8
+
+Input is one question per line, or NDJSON with a "question" field. Nothing is
+written to MongoDB; pass --use-faqs to also consult db.faqs as the live bot does.
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from app.services import nlp
+from app.services.batch import parse_questions, stream_ndjson, summarize
+
+
+async def _main(args: argparse.Namespace) -> None:
+	with open(args.input, "r", encoding="utf-8") as f:
+		questions = parse_questions(f)
+
+	await nlp.load_nlp_resources()
+
+	db = None
+	if args.use_faqs:
+		from app.database import connect_to_mongo, close_mongo_connection, get_db
+		await connect_to_mongo()
+		db = get_db()
+
+	out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+	results = []
+	try:
+		async for line in stream_ndjson(
+			questions,
+			db=db,
+			top_k=args.top_k,
+			batch_size=args.batch_size,
+			concurrency=args.concurrency,
+		):
+			out.write(line)
+			out.flush()
+			results.append(json.loads(line))
+	finally:
+		if out is not sys.stdout:
+			out.close()
+		if db is not None:
+			await close_mongo_connection()
+
+	print(json.dumps(summarize(results)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("input", help="questions file (plain lines or NDJSON)")
+	parser.add_argument("-o", "--output", help="NDJSON output path (default: stdout)")
+	parser.add_argument("--top-k", type=int, default=5)
+	parser.add_argument("--batch-size", type=int, default=64)
+	parser.add_argument("--concurrency", type=int, default=8, help="max questions in flight (bounds Gemini calls)")
+	parser.add_argument("--use-faqs", action="store_true", help="consult db.faqs as a last resort (needs MongoDB)")
+	asyncio.run(_main(parser.parse_args()))
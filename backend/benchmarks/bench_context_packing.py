@@ -0,0 +1,116 @@
+"""Compare Gemini prompt size (and optionally latency) before and after context packing.
+
+Run from backend/:
+    python -m benchmarks.bench_context_packing
+    python -m benchmarks.bench_context_packing --queries replay.txt --count-tokens --live
+
+"before" is the previous behaviour: the top-2 cleaned chunks joined verbatim.
+"after" is pack_context with CONTEXT_TOKEN_BUDGET and CONTEXT_MAX_CHUNKS. Token counts
+are estimates (chars / 4) unless --count-tokens asks Gemini's count_tokens endpoint;
+--live also times a real generation for each prompt. Both need GEMINI_API_KEY.
+--stub-model ranks with the offline hashing encoder from stress_reindex instead of MiniLM.
+
+Caveats, also printed with the results:
+  * Latency is only measured with --live. No latency numbers have been recorded for
+    this change yet.
+  * The only recorded run used --stub-model, so chunk selection (and hence token
+    counts) may differ from production MiniLM ranking. On the shipped KB that run gave
+    225.5 estimated context tokens before and after: every paragraph is a single
+    window with its own title, so there is nothing to deduplicate.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from app.services import nlp
+from benchmarks.bench_query_encoding import DEFAULT_QUERIES
+from benchmarks.stress_reindex import HashingEncoder
+
+
+def _old_context(ranked) -> str:
+    return "\n\n".join(r[2] for r in ranked[:2])
+
+
+def _new_context(index, ranked) -> str:
+    relevant = [r[0] for r in ranked if r[3] >= nlp.MIN_COMPOSITE_THRESHOLD]
+    return nlp.pack_context(index, relevant)
+
+
+async def _count_tokens(prompt: str, use_api: bool) -> int:
+    if not use_api:
+        return nlp._estimate_tokens(prompt)
+    res = await nlp._gemini_client.aio.models.count_tokens(model="gemini-2.5-flash", contents=prompt)
+    return int(res.total_tokens)
+
+
+async def _time_generation(prompt: str) -> float:
+    start = time.perf_counter()
+    await nlp._gemini_client.aio.models.generate_content(
+        model="gemini-2.5-flash", contents=prompt, config=nlp._GENERATION_CONFIG
+    )
+    return time.perf_counter() - start
+
+
+def _summary(label: str, values: List[float], unit: str) -> str:
+    if not values:
+        return f"{label}: n/a"
+    return f"{label}: mean {statistics.mean(values):.1f}{unit}, median {statistics.median(values):.1f}{unit}"
+
+
+async def main(args: argparse.Namespace) -> None:
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    if args.stub_model:
+        nlp._embed_model = HashingEncoder()
+    await nlp.load_nlp_resources()
+    if (args.count_tokens or args.live) and nlp._gemini_client is None:
+        raise SystemExit("GEMINI_API_KEY is required for --count-tokens/--live")
+    index = nlp.get_index()
+
+    tokens = {"before": [], "after": []}
+    context_tokens = {"before": [], "after": []}
+    latency = {"before": [], "after": []}
+    relevant_counts: List[float] = []
+    for text in queries:
+        q = nlp.QueryContext(text)
+        if not nlp._is_legal_query(q):
+            continue
+        ranked = nlp._rank_matches(q, await nlp._vector_search(q, top_k=5, index=index))
+        if not ranked or ranked[0][3] < nlp.MIN_COMPOSITE_THRESHOLD:
+            continue
+        relevant_counts.append(sum(1 for r in ranked if r[3] >= nlp.MIN_COMPOSITE_THRESHOLD))
+        for label, context in (("before", _old_context(ranked)), ("after", _new_context(index, ranked))):
+            prompt = nlp.build_prompt(text, context)
+            tokens[label].append(await _count_tokens(prompt, args.count_tokens))
+            context_tokens[label].append(nlp._estimate_tokens(context))
+            if args.live:
+                latency[label].append(1000 * await _time_generation(prompt))
+
+    print(f"{len(tokens['after'])} queries reached generation")
+    print("ranking: " + ("offline hashing encoder (--stub-model), not MiniLM" if args.stub_model else "MiniLM"))
+    print("tokens: " + ("Gemini count_tokens" if args.count_tokens else "estimated (chars / 4)"))
+    if not args.live:
+        print("latency: not measured (pass --live with GEMINI_API_KEY)")
+    print(_summary("relevant chunks per query", relevant_counts, ""))
+    for label in ("before", "after"):
+        print(_summary(f"{label:<6} prompt tokens", tokens[label], ""))
+        print(_summary(f"{label:<6} context tokens (est.)", context_tokens[label], ""))
+        if args.live:
+            print(_summary(f"{label:<6} generation latency", latency[label], " ms"))
+    if tokens["before"] and tokens["after"]:
+        saved = 1 - sum(tokens["after"]) / sum(tokens["before"])
+        print(f"prompt tokens saved: {saved:.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", help="file with one query per line (default: built-in sample)")
+    parser.add_argument("--count-tokens", action="store_true", help="count tokens with the Gemini API")
+    parser.add_argument("--live", action="store_true", help="also time a real generation per prompt")
+    parser.add_argument("--stub-model", action="store_true", help="rank with an offline hashing encoder instead of MiniLM")
+    asyncio.run(main(parser.parse_args()))
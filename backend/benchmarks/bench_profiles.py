@@ -0,0 +1,77 @@
+"""Compare cold-start cost of the api, inference and all-in-one app profiles.
+
+Run from backend/:
+    python -m benchmarks.bench_profiles
+    python -m benchmarks.bench_profiles --startup
+
+Each profile's entry module is imported in a fresh interpreter, which reports the
+import time, peak RSS and whether torch / sentence-transformers / google-genai got
+loaded. --startup also runs the app's startup handlers (MongoDB must be reachable;
+the inference profiles then load the embedding model and index the KB), which is
+where most of the inference profile's memory goes.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+ENTRY_MODULES = {
+    "api": "app.api_app",
+    "inference": "app.inference_app",
+    "all": "app.main",
+}
+
+HEAVY_MODULES = ("torch", "sentence_transformers", "google.genai")
+
+_PROBE = """
+import asyncio, json, resource, sys, time
+start = time.perf_counter()
+module = __import__({module!r}, fromlist=["app"])
+imported = time.perf_counter() - start
+started = None
+if {startup!r}:
+    async def _run():
+        await module.app.router.startup()
+        await module.app.router.shutdown()
+    start = time.perf_counter()
+    asyncio.run(_run())
+    started = time.perf_counter() - start
+# ru_maxrss is KiB on Linux, bytes on macOS
+scale = 1 if sys.platform == "darwin" else 1024
+print(json.dumps({{
+    "import_s": imported,
+    "startup_s": started,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def _probe(module: str, startup: bool) -> dict:
+    code = _PROBE.format(module=module, startup=startup, heavy=HEAVY_MODULES)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(f"{module} failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(args: argparse.Namespace) -> int:
+    failed = False
+    for profile in args.profiles:
+        res = _probe(ENTRY_MODULES[profile], args.startup)
+        line = f"{profile:<10} import {res['import_s']:.2f}s"
+        if res["startup_s"] is not None:
+            line += f", startup {res['startup_s']:.2f}s"
+        line += f", peak RSS {res['rss_mb']:.0f} MB, heavy modules: {', '.join(res['heavy']) or 'none'}"
+        print(line)
+        if profile == "api" and res["heavy"]:
+            print("  api profile must not import the NLP stack")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", choices=sorted(ENTRY_MODULES), default=list(ENTRY_MODULES))
+    parser.add_argument("--startup", action="store_true", help="also run the startup handlers")
+    sys.exit(main(parser.parse_args()))
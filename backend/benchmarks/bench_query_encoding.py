@@ -0,0 +1,140 @@
+"""Count embedding-model calls per request in the answer pipeline.
+
+Run from backend/:
+    python -m benchmarks.bench_query_encoding
+    python -m benchmarks.bench_query_encoding --queries replay.txt --repeat 3
+
+To compare against an older pipeline, export its nlp.py and pass it with --before:
+    git show <rev>:backend/app/services/nlp.py > /tmp/nlp_before.py
+    python -m benchmarks.bench_query_encoding --before /tmp/nlp_before.py
+
+Gemini is disabled so the numbers only reflect retrieval. Two scenarios are measured:
+"chat" (generate_bot_response) and "debug" (vector search followed by the pipeline,
+as /admin/debug_query does). --stub-model swaps MiniLM for the offline hashing encoder
+from stress_reindex; call counts do not depend on the model, timings do.
+
+Measured with --stub-model on CPU, "before" being nlp.py as of the baseline commit
+(its debug path re-encoded the query inside generate_bot_response):
+
+    pipeline scenario  calls/req (--repeat 1)  calls/req (--repeat 3)
+    before   chat           0.90                    0.90
+    before   debug          1.90                    1.90
+    after    chat           0.80                    0.27
+    after    debug          0.90                    0.30
+
+Greetings are answered without encoding (hence < 1 call/request). With --repeat 3 the
+query-embedding LRU serves every replayed query, so only first occurrences are encoded.
+"""
+import argparse
+import asyncio
+import importlib.util
+import time
+from typing import List
+
+from app.services import nlp
+from benchmarks.stress_reindex import HashingEncoder
+
+
+DEFAULT_QUERIES = [
+    "How to file a consumer complaint online?",
+    "I lost my driving licence, what should I do?",
+    "Where to report cyber crime fraud?",
+    "how to file a consumer complaint online",
+    "Tell me the URL for legal aid",
+    "What is the procedure for a land dispute in civil court?",
+    "Hello, who are you?",
+    "I lost my aadhaar card",
+    "family dispute mediation process",
+    "Where to report cyber crime fraud?",
+]
+
+
+class CountingModel:
+    """Wraps a SentenceTransformer and counts encode calls and texts encoded."""
+
+    def __init__(self, model) -> None:
+        self._model = model
+        self.calls = 0
+        self.texts = 0
+
+    def encode(self, sentences, *args, **kwargs):
+        self.calls += 1
+        self.texts += 1 if isinstance(sentences, str) else len(sentences)
+        return self._model.encode(sentences, *args, **kwargs)
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.texts = 0
+
+
+def _load_module(path: str):
+    spec = importlib.util.spec_from_file_location("nlp_before", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+async def _run(module, counter: CountingModel, queries: List[str], scenario: str) -> dict:
+    counter.reset()
+    start = time.perf_counter()
+    for q in queries:
+        if scenario == "debug":
+            query = module.QueryContext(q) if hasattr(module, "QueryContext") else q
+            matches = await module._vector_search(query, top_k=5)
+            if hasattr(module, "generate_bot_response_traced"):
+                await module.generate_bot_response_traced(query, None, matches=matches)
+            else:
+                await module.generate_bot_response(q, None)
+        else:
+            await module.generate_bot_response(q, None)
+    elapsed = time.perf_counter() - start
+    n = max(1, len(queries))
+    return {
+        "calls_per_request": counter.calls / n,
+        "texts_per_request": counter.texts / n,
+        "ms_per_request": 1000 * elapsed / n,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    queries = queries * args.repeat
+
+    if args.stub_model:
+        nlp._embed_model = HashingEncoder()
+    await nlp.load_nlp_resources()
+    nlp._gemini_client = None
+    counter = CountingModel(nlp._embed_model)
+
+    modules = []
+    if args.before:
+        before = _load_module(args.before)
+        # Share the already-built model and index with the old pipeline
+        before._embed_model = counter
+        before._kb_chunks = list(nlp.get_index().chunks)
+        before._kb_embeddings = nlp.get_index().embeddings
+        before._gemini_client = None
+        modules.append(("before", before))
+    nlp._embed_model = counter
+    modules.append(("after", nlp))
+
+    print(f"{len(queries)} requests")
+    print(f"{'pipeline':<8} {'scenario':<8} {'calls/req':>10} {'texts/req':>10} {'ms/req':>8}")
+    for label, module in modules:
+        for scenario in ("chat", "debug"):
+            if hasattr(module, "clear_embedding_cache"):
+                module.clear_embedding_cache()
+            r = await _run(module, counter, queries, scenario)
+            print(f"{label:<8} {scenario:<8} {r['calls_per_request']:>10.2f} {r['texts_per_request']:>10.2f} {r['ms_per_request']:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", help="file with one query per line (default: built-in sample)")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the query set this many times")
+    parser.add_argument("--before", help="path to an older nlp.py to compare against")
+    parser.add_argument("--stub-model", action="store_true", help="use the offline hashing encoder instead of MiniLM")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,164 @@
+"""Stress the KB index swap: run queries continuously while reindexing over and over.
+
+Run from backend/:
+    python -m benchmarks.stress_reindex --seconds 30 --workers 8
+
+Two variants of knowledge_base.txt are written to a temp dir with different chunk
+counts and order, every chunk tagged with its variant. The index is rebuilt
+alternately from each while query workers (on the event loop and in threads via the
+batch path) check every result:
+  * no exceptions and no empty result sets,
+  * all returned chunks belong to one variant's index (no new-chunks/old-embeddings mix),
+  * the top chunk is the one that variant's own index returns for the query.
+Exits non-zero on any violation.
+
+--stub-model swaps the sentence-transformer for a small hashed bag-of-words encoder,
+so the test runs offline; the swap logic under test is the same either way.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Set
+
+import torch
+
+from app.services import nlp
+
+
+QUERIES = [
+    "how to file a consumer complaint",
+    "lost driving licence duplicate",
+    "report cyber crime online",
+    "free legal aid lawyer",
+    "land dispute civil court",
+    "lost aadhaar card",
+    "family court divorce mediation",
+    "police complaint for theft",
+]
+
+
+def _write_variants(src: str, out_dir: str) -> Dict[str, str]:
+    with open(src, "r", encoding="utf-8") as f:
+        paragraphs = [p.strip() for p in f.read().split("\n\n") if p.strip()]
+    variants = {
+        "kb-a": paragraphs,
+        "kb-b": list(reversed(paragraphs)) + ["Title: Extra\nAn additional paragraph so the chunk count differs."],
+    }
+    paths = {}
+    for tag, paras in variants.items():
+        path = os.path.join(out_dir, f"{tag}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(f"[{tag}] {p}" for p in paras))
+        paths[tag] = path
+    return paths
+
+
+def _variants_of(chunks: List[str], variant_chunks: Dict[str, Set[str]]) -> List[str]:
+    # Windows past the first of a long paragraph carry no tag and can be identical in
+    # both variants, so a result belongs to every variant that contains all its chunks
+    return [tag for tag, known in variant_chunks.items() if all(c in known for c in chunks)]
+
+
+class HashingEncoder:
+    """Offline stand-in for SentenceTransformer.encode: hashed bag of words, L2-normalized."""
+
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = dim
+
+    def encode(self, texts, convert_to_tensor=True, normalize_embeddings=True):
+        out = torch.zeros(len(texts), self.dim)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                out[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        return torch.nn.functional.normalize(out, dim=1)
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.queries = 0
+        self.reindexes = 0
+        self.errors: List[str] = []
+
+
+def _check(stats: Stats, query: str, matches, expected: Dict[str, Dict[str, str]], variant_chunks: Dict[str, Set[str]]) -> None:
+    stats.queries += 1
+    if not matches:
+        stats.errors.append(f"empty result for {query!r}")
+        return
+    variants = _variants_of([c for c, _ in matches], variant_chunks)
+    if not variants:
+        stats.errors.append(f"result for {query!r} mixes chunks of different KB versions")
+    elif all(matches[0][0] != expected[v][query] for v in variants):
+        stats.errors.append(f"wrong top chunk for {query!r} in {'/'.join(variants)}")
+
+
+async def _loop_worker(stats: Stats, expected, variant_chunks, deadline: float) -> None:
+    while time.monotonic() < deadline:
+        q = random.choice(QUERIES)
+        try:
+            _check(stats, q, await nlp._vector_search(q, top_k=5), expected, variant_chunks)
+            await nlp.generate_bot_response_traced(q, None)
+        except Exception as e:
+            stats.errors.append(f"{type(e).__name__}: {e}")
+        await asyncio.sleep(0)
+
+
+async def _batch_worker(stats: Stats, expected, variant_chunks, deadline: float) -> None:
+    while time.monotonic() < deadline:
+        batch = random.sample(QUERIES, 4)
+        try:
+            for q, matches in zip(batch, await nlp._vector_search_batch(batch, top_k=5)):
+                _check(stats, q, matches, expected, variant_chunks)
+        except Exception as e:
+            stats.errors.append(f"{type(e).__name__}: {e}")
+
+
+async def _reindexer(stats: Stats, paths: Dict[str, str], deadline: float) -> None:
+    tags = sorted(paths)
+    while time.monotonic() < deadline:
+        await nlp.reindex_knowledge_base(paths[tags[stats.reindexes % len(tags)]])
+        stats.reindexes += 1
+
+
+async def main(args: argparse.Namespace) -> int:
+    if args.stub_model:
+        nlp._embed_model = HashingEncoder()
+    await nlp.load_nlp_resources()
+    nlp._gemini_client = None
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = _write_variants(nlp.KNOWLEDGE_BASE_PATH, tmp)
+        expected: Dict[str, Dict[str, str]] = {}
+        variant_chunks: Dict[str, Set[str]] = {}
+        for tag, path in paths.items():
+            index = await asyncio.to_thread(nlp._build_index, path)
+            variant_chunks[tag] = set(index.chunks)
+            embs = nlp._encode_cached([nlp.QueryContext(q).normalized for q in QUERIES])
+            tops = nlp._search_embeddings(index, embs, 1)
+            expected[tag] = {q: top[0][0] for q, top in zip(QUERIES, tops)}
+
+        # Start from a tagged variant; the KB loaded at startup belongs to neither
+        await nlp.reindex_knowledge_base(paths[sorted(paths)[0]])
+        stats = Stats()
+        deadline = time.monotonic() + args.seconds
+        workers = [_loop_worker(stats, expected, variant_chunks, deadline) for _ in range(args.workers)]
+        workers += [_batch_worker(stats, expected, variant_chunks, deadline) for _ in range(max(1, args.workers // 2))]
+        await asyncio.gather(_reindexer(stats, paths, deadline), *workers)
+
+    print(f"{stats.queries} checked queries, {stats.reindexes} reindexes, {len(stats.errors)} violations")
+    for err in stats.errors[:20]:
+        print("  " + err)
+    return 1 if stats.errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--stub-model", action="store_true", help="use an offline hashing encoder instead of MiniLM")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.routes import chats as chats_route
+from app.services import archive
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+OLD = datetime(2020, 1, 1)  # well past MESSAGE_HOT_DAYS
+
+
+@pytest.fixture(params=["collection", "zstd"])
+def db(request, tmp_path, monkeypatch):
+    if request.param == "zstd":
+        pytest.importorskip("zstandard")
+    monkeypatch.setattr(archive, "MESSAGE_ARCHIVE_BACKEND", request.param)
+    monkeypatch.setattr(archive, "MESSAGE_ARCHIVE_DIR", str(tmp_path / "archive"))
+    return mongomock_motor.AsyncMongoMockClient().db
+
+
+async def _chat_with_messages(db, n: int):
+    user_id = ObjectId()
+    chat_id = (await db.chats.insert_one({"userId": user_id, "createdAt": OLD})).inserted_id
+    for i in range(n):
+        await _add_message(db, chat_id, i)
+    return user_id, chat_id
+
+
+async def _add_message(db, chat_id, minute: int) -> None:
+    ts = OLD + timedelta(minutes=minute)
+    await db.messages.insert_one({"chatId": chat_id, "sender": "user", "text": f"m{minute}", "timestamp": ts})
+    await db.chats.update_one({"_id": chat_id}, {"$set": {"lastMessageAt": ts}})
+
+
+async def _history(db, user_id, chat_id):
+    messages = await chats_route.get_messages(str(chat_id), user_id=str(user_id), db=db)
+    return [m.text for m in messages]
+
+
+def test_archive_new_message_rearchive_keeps_full_history_once(db):
+    async def scenario():
+        user_id, chat_id = await _chat_with_messages(db, 5)
+        await archive.run_archive(db)
+        assert await db.messages.count_documents({}) == 0
+        first = await _history(db, user_id, chat_id)
+
+        await _add_message(db, chat_id, 5)
+        assert await _history(db, user_id, chat_id) == first + ["m5"]
+        await archive.run_archive(db)
+        assert await db.messages.count_documents({}) == 0
+        return first, await _history(db, user_id, chat_id)
+
+    first, after = asyncio.run(scenario())
+    assert first == [f"m{i}" for i in range(5)]
+    assert after == [f"m{i}" for i in range(6)]
+
+
+def test_crash_before_hot_delete_then_rerun_has_no_duplicates(db, monkeypatch):
+    async def scenario():
+        user_id, chat_id = await _chat_with_messages(db, 4)
+        collection_type = type(db.chats)  # collection objects are created per attribute access
+        real_update = collection_type.update_one
+
+        async def crash_on_archived_through(self, flt, update, *args, **kwargs):
+            if self.name == "chats" and "archivedThrough" in update.get("$set", {}):
+                raise RuntimeError("worker died")
+            return await real_update(self, flt, update, *args, **kwargs)
+
+        # Archive copy written (and for zstd, the segment recorded), hot copies not deleted
+        monkeypatch.setattr(collection_type, "update_one", crash_on_archived_through)
+        with pytest.raises(RuntimeError):
+            await archive.run_archive(db)
+        monkeypatch.setattr(collection_type, "update_one", real_update)
+        assert await _history(db, user_id, chat_id) == [f"m{i}" for i in range(4)]
+
+        await archive.run_archive(db)
+        chat = await db.chats.find_one({"_id": chat_id})
+        return chat, await _history(db, user_id, chat_id)
+
+    chat, history = asyncio.run(scenario())
+    assert history == [f"m{i}" for i in range(4)]
+    assert len(chat.get("archiveSegments", [])) <= 1  # no second frame for the same messages
+
+
+def test_duplicated_segment_frame_is_read_back_once(db):
+    if archive.MESSAGE_ARCHIVE_BACKEND != "zstd":
+        pytest.skip("segments only exist on the zstd backend")
+
+    async def scenario():
+        user_id, chat_id = await _chat_with_messages(db, 3)
+        await archive.run_archive(db)
+        chat = await db.chats.find_one({"_id": chat_id})
+        # What two workers archiving the same chat at once used to leave behind
+        await db.chats.update_one({"_id": chat_id}, {"$push": {"archiveSegments": chat["archiveSegments"][0]}})
+        return await _history(db, user_id, chat_id)
+
+    assert asyncio.run(scenario()) == ["m0", "m1", "m2"]
+
+
+def test_disabling_ttl_drops_the_ttl_index(db, monkeypatch):
+    async def ttl_indexes():
+        names = []
+        for coll in ("messages", "messages_archive"):
+            names += [n for n in (await db[coll].index_information()) if n == "timestamp_ttl"]
+        return names
+
+    async def scenario():
+        await db.messages.insert_one({"timestamp": OLD})
+        await db.messages_archive.insert_one({"timestamp": OLD})
+        monkeypatch.setattr(archive, "MESSAGE_TTL_DAYS", 90)
+        await archive.ensure_indexes(db)
+        enabled = await ttl_indexes()
+        monkeypatch.setattr(archive, "MESSAGE_TTL_DAYS", 0)
+        await archive.ensure_indexes(db)
+        await archive.ensure_indexes(db)  # nothing left to drop is not an error
+        return enabled, await ttl_indexes()
+
+    enabled, disabled = asyncio.run(scenario())
+    assert len(enabled) == 2
+    assert disabled == []
+
+
+def test_expired_segments_are_purged_and_unlinked(db, monkeypatch):
+    if archive.MESSAGE_ARCHIVE_BACKEND != "zstd":
+        pytest.skip("segments only exist on the zstd backend")
+    monkeypatch.setattr(archive, "MESSAGE_TTL_DAYS", 30)
+
+    async def scenario():
+        user_id, chat_id = await _chat_with_messages(db, 2)
+        other = (await db.chats.insert_one({"userId": user_id, "createdAt": OLD, "lastMessageAt": OLD})).inserted_id
+        report = await archive.run_archive(db)
+        chat = await db.chats.find_one({"_id": chat_id})
+        return report, chat, await db.chats.find_one({"_id": other})
+
+    report, chat, other = asyncio.run(scenario())
+    assert report["purgedSegments"] == 1
+    assert chat["archiveSegments"] == []
+    assert "archiveSegments" not in other
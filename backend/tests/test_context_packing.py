@@ -0,0 +1,44 @@
+import pytest
+
+from app.services import nlp
+from benchmarks.stress_reindex import HashingEncoder
+
+
+def _index(tmp_path, monkeypatch, paragraphs):
+    monkeypatch.setattr(nlp, "_embed_model", HashingEncoder())
+    path = tmp_path / "kb.txt"
+    path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+    return nlp._build_index(str(path))
+
+
+def _words(prefix: str, n_chars: int) -> str:
+    text = " ".join(f"{prefix}{i}" for i in range(n_chars))
+    return text[:n_chars].rsplit(" ", 1)[0]
+
+
+def test_default_budget_keeps_both_full_size_chunks(tmp_path, monkeypatch):
+    index = _index(tmp_path, monkeypatch, [
+        "Title: Alpha\n" + _words("alpha", 980),
+        "Title: Beta\n" + _words("beta", 980),
+    ])
+    assert len(index.chunks) == 2
+    packed = nlp.pack_context(index, list(index.chunks))
+    assert "alpha1 " in packed and "beta1 " in packed
+
+
+def test_overlapping_windows_are_merged_not_dropped(tmp_path, monkeypatch):
+    index = _index(tmp_path, monkeypatch, ["Title: Long\n" + _words("w", 1600)])
+    assert len(index.chunks) == 2  # two windows sharing a 200-char overlap
+    old_join = "\n\n".join(nlp._clean_chunk_text(c) for c in index.chunks)
+    packed = nlp.pack_context(index, list(index.chunks))
+    assert len(packed) < len(old_join)
+    last_word = index.paragraphs[0].split()[-1]
+    assert packed.endswith(last_word)
+
+
+@pytest.mark.parametrize("n_relevant", [1, 2, 5])
+def test_packed_context_never_exceeds_old_top2_join(tmp_path, monkeypatch, n_relevant):
+    index = _index(tmp_path, monkeypatch, [f"Title: T{i}\n" + _words(f"p{i}x", 700) for i in range(5)])
+    ranked = list(index.chunks)[:n_relevant]
+    old_join = "\n\n".join(nlp._clean_chunk_text(c) for c in ranked[:2])
+    assert len(nlp.pack_context(index, ranked)) <= len(old_join)
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from app.services import nlp
+from benchmarks.stress_reindex import HashingEncoder
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    monkeypatch.setattr(nlp, "_embed_model", HashingEncoder())
+    monkeypatch.setattr(nlp, "_gemini_client", None)
+    nlp.clear_embedding_cache()
+    old = tmp_path / "old.txt"
+    old.write_text("Title: Legal Aid\nFree legal aid is available from the DLSA.", encoding="utf-8")
+    new = tmp_path / "new.txt"
+    new.write_text("Title: Cyber Crime\nReport cyber crime at cybercrime.gov.in.", encoding="utf-8")
+    old_index, new_index = nlp._build_index(str(old)), nlp._build_index(str(new))
+    monkeypatch.setattr(nlp, "_index", old_index)
+    return old_index, new_index
+
+
+def test_explicit_empty_snapshot_is_not_replaced_by_the_live_index(kb):
+    empty = nlp.KBIndex((), None, "")
+    assert asyncio.run(nlp._vector_search("free legal aid", top_k=3, index=empty)) == []
+    assert asyncio.run(nlp._vector_search("free legal aid", top_k=3)) != []
+
+
+def test_batch_answers_use_the_snapshot_they_were_searched_with(kb, monkeypatch):
+    old_index, new_index = kb
+    search = nlp._vector_search_batch
+    traced = nlp.generate_bot_response_traced
+    seen = []
+
+    async def search_then_reindex(*args, **kwargs):
+        result = await search(*args, **kwargs)
+        nlp._index = new_index  # a reindex lands between search and answering
+        return result
+
+    async def record(*args, **kwargs):
+        seen.append(kwargs.get("index"))
+        return await traced(*args, **kwargs)
+
+    monkeypatch.setattr(nlp, "_vector_search_batch", search_then_reindex)
+    monkeypatch.setattr(nlp, "generate_bot_response_traced", record)
+
+    async def run():
+        return [r async for r in nlp.answer_questions_batch(["free legal aid", "legal aid lawyer"], top_k=3)]
+
+    results = asyncio.run(run())
+    assert len(results) == 2
+    assert len(seen) == 2 and all(i is old_index for i in seen)
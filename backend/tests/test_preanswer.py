@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services import nlp, preanswer
+from benchmarks.stress_reindex import HashingEncoder
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(nlp, "_embed_model", HashingEncoder())
+    monkeypatch.setattr(nlp, "_precomputed", ([], [], None, ""))
+    monkeypatch.setattr(preanswer, "LEASE_POLL_SECONDS", 0.01)
+    return mongomock_motor.AsyncMongoMockClient().db
+
+
+async def _hold_lease(db, owner: str = "other-worker") -> None:
+    await db.job_leases.insert_one({
+        "_id": preanswer.LEASE_NAME,
+        "owner": owner,
+        "expiresAt": datetime.now(tz=timezone.utc) + timedelta(minutes=5),
+    })
+
+
+def test_worker_that_loses_the_lease_loads_the_winners_table(db):
+    async def scenario():
+        await _hold_lease(db)
+        task = preanswer.schedule_rebuild(db)
+        await asyncio.sleep(0.05)
+        assert not task.done()  # waiting for the other worker
+        await db.precomputed_answers.insert_one({"question": "lost aadhaar card", "answer": "Apply at UIDAI.", "kbVersion": ""})
+        await db.job_leases.delete_one({"_id": preanswer.LEASE_NAME})
+        await asyncio.wait_for(task, 1)
+
+    asyncio.run(scenario())
+    assert nlp._precomputed[0] == ["lost aadhaar card"]
+    assert nlp._precomputed[1] == ["Apply at UIDAI."]
+
+
+def test_schedule_rebuild_reuses_a_table_already_built_for_this_kb(db, monkeypatch):
+    async def must_not_run(*args, **kwargs):
+        raise AssertionError("rebuilt although a table for this KB version exists")
+
+    monkeypatch.setattr(preanswer, "rebuild_precomputed_answers", must_not_run)
+
+    async def scenario():
+        await db.precomputed_answers.insert_one({"question": "free legal aid", "answer": "Contact DLSA.", "kbVersion": ""})
+        await preanswer.schedule_rebuild(db)
+
+    asyncio.run(scenario())
+    assert nlp._precomputed[0] == ["free legal aid"]
@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app import ratelimit
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "memory":
+        s = ratelimit.MemoryLimiterStore()
+    else:
+        s = ratelimit.SQLiteLimiterStore(str(tmp_path / "limits.sqlite3"))
+    monkeypatch.setattr(ratelimit, "_store", s)
+    return s
+
+
+def _advance_clock(monkeypatch, seconds: float) -> None:
+    # The memory store uses time.monotonic, the SQLite store time.time
+    for name in ("monotonic", "time"):
+        real = getattr(time, name)
+        monkeypatch.setattr(ratelimit.time, name, lambda real=real: real() + seconds)
+
+
+def test_bucket_allows_burst_then_refills(store, monkeypatch):
+    rate = 1.0  # tokens per second
+    assert store.take_token("user:a", rate, 2) == 0
+    assert store.take_token("user:a", rate, 2) == 0
+    wait = store.take_token("user:a", rate, 2)
+    assert 0 < wait <= 1
+    assert store.take_token("user:b", rate, 2) == 0  # buckets are per key
+    _advance_clock(monkeypatch, 1.1)
+    assert store.take_token("user:a", rate, 2) == 0
+
+
+def test_empty_bucket_raises_429_with_retry_after(store, monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_PER_MINUTE", 6.0)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_BURST", 1.0)
+    ratelimit.enforce_user_rate_limit("u1")
+    with pytest.raises(HTTPException) as exc:
+        ratelimit.enforce_user_rate_limit("u1")
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "10"
+
+
+def _limits(monkeypatch, concurrency: int, queue: int, timeout: float = 0.2, mode: str = "reject") -> None:
+    monkeypatch.setattr(ratelimit, "CHAT_MAX_CONCURRENCY", concurrency)
+    monkeypatch.setattr(ratelimit, "CHAT_MAX_QUEUE", queue)
+    monkeypatch.setattr(ratelimit, "CHAT_QUEUE_TIMEOUT", timeout)
+    monkeypatch.setattr(ratelimit, "CHAT_SHED_MODE", mode)
+
+
+def test_full_queue_is_shed_with_503(store, monkeypatch):
+    _limits(monkeypatch, concurrency=1, queue=0)
+
+    async def scenario():
+        async with ratelimit.generation_slot() as admitted:
+            assert admitted is True
+            with pytest.raises(HTTPException) as exc:
+                async with ratelimit.generation_slot():
+                    pass
+            return exc.value
+
+    err = asyncio.run(scenario())
+    assert err.status_code == 503
+    assert err.headers["Retry-After"] == str(ratelimit.CHAT_RETRY_AFTER)
+    assert store.stats() == {"running": 0, "waiting": 0}
+
+
+def test_queued_request_times_out_and_degrades(store, monkeypatch):
+    _limits(monkeypatch, concurrency=1, queue=4, timeout=0.1, mode="degrade")
+
+    async def scenario():
+        async with ratelimit.generation_slot():
+            async with ratelimit.generation_slot() as admitted:
+                return admitted
+
+    assert asyncio.run(scenario()) is False
+    assert store.stats() == {"running": 0, "waiting": 0}
+
+
+def test_waiter_is_admitted_when_a_slot_frees(store, monkeypatch):
+    _limits(monkeypatch, concurrency=1, queue=4, timeout=2)
+
+    async def scenario():
+        order = []
+
+        async def worker(name, hold):
+            async with ratelimit.generation_slot():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        first = asyncio.create_task(worker("first", 0.1))
+        await asyncio.sleep(0.02)
+        await asyncio.gather(first, worker("second", 0))
+        return order
+
+    assert asyncio.run(scenario()) == ["first", "second"]
+    assert store.stats() == {"running": 0, "waiting": 0}
+
+
+def test_cancelled_acquires_do_not_leak_slots(store, monkeypatch):
+    _limits(monkeypatch, concurrency=1, queue=5, timeout=5)
+    if isinstance(store, ratelimit.SQLiteLimiterStore):
+        # Make the insert slow enough that the cancel lands while it runs in its thread
+        enter = store._try_enter
+        monkeypatch.setattr(store, "_try_enter", lambda *a: (time.sleep(0.05), enter(*a))[1])
+
+    async def scenario():
+        async def client():
+            async with ratelimit.generation_slot():
+                await asyncio.sleep(10)
+
+        tasks = [asyncio.create_task(client()) for _ in range(20)]
+        await asyncio.sleep(0.01)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Cancelled inserts are cleaned up in the background once their thread finishes
+        for _ in range(100):
+            if store.stats() == {"running": 0, "waiting": 0}:
+                break
+            await asyncio.sleep(0.02)
+        # And the store still admits new work
+        async with ratelimit.generation_slot() as admitted:
+            return admitted
+
+    assert asyncio.run(scenario()) is True
+    assert store.stats() == {"running": 0, "waiting": 0}
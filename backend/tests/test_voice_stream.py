@@ -0,0 +1,120 @@
+import json
+from array import array
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import ratelimit
+from app.database import get_db
+from app.routes import voice as voice_route
+from app.security import create_access_token
+from app.services import voice
+
+
+SPEECH = array("h", [3000] * 16000).tobytes()   # 1 s of loud 16 kHz audio
+SILENCE = bytes(2 * 16000)                      # 1 s of silence
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("VOICE_STT_BACKEND", "fake")
+    monkeypatch.setenv("VOICE_TTS_BACKEND", "fake")
+    monkeypatch.setattr(voice, "_stt_backend", None)
+    monkeypatch.setattr(voice, "_tts_backend", None)
+    monkeypatch.setattr(ratelimit, "_store", None)
+
+    async def fake_answer(text, db, use_llm=True):
+        return f"Answer to {text}. Second sentence."
+
+    monkeypatch.setattr(voice_route, "generate_bot_response", fake_answer)
+    app = FastAPI()
+    app.include_router(voice_route.router, prefix="/voice")
+    app.dependency_overrides[get_db] = lambda: None
+    return TestClient(app)
+
+
+def _url() -> str:
+    return f"/voice/stream?token={create_access_token('64b7f0c2a1b2c3d4e5f60718')}"
+
+
+def _receive_reply(ws) -> list:
+    """Collect JSON frames up to audio_end, checking the announced audio arrives in full."""
+    frames = []
+    while True:
+        msg = json.loads(ws.receive_text())
+        frames.append(msg)
+        if msg["type"] == "audio":
+            received = 0
+            while received < msg["bytes"]:
+                received += len(ws.receive_bytes())
+            assert received == msg["bytes"]
+        if msg["type"] in ("audio_end", "error"):
+            return frames
+
+
+def test_utterance_is_transcribed_answered_and_spoken(client):
+    with client.websocket_connect(_url()) as ws:
+        ws.send_bytes(SPEECH)
+        ws.send_bytes(SILENCE)
+        frames = _receive_reply(ws)
+    types = [f["type"] for f in frames]
+    assert types[:3] == ["speech_start", "final", "answer"]
+    assert frames[1]["text"] == "how to file a consumer complaint"
+    assert frames[2]["text"] == "Answer to how to file a consumer complaint. Second sentence."
+    assert types.count("audio") == 2
+    assert types[-1] == "audio_end"
+
+
+def test_bad_sample_rate_is_rejected_without_hanging(client):
+    with client.websocket_connect(_url()) as ws:
+        for bad in (20, -16000, "abc", [1]):
+            ws.send_text(json.dumps({"type": "config", "sample_rate": bad}))
+            assert json.loads(ws.receive_text())["type"] == "error"
+        ws.send_text(json.dumps({"type": "config", "sample_rate": 8000}))
+        ws.send_bytes(SPEECH[:16000])
+        ws.send_text(json.dumps({"type": "end_utterance"}))
+        assert _receive_reply(ws)[-1]["type"] == "audio_end"
+
+
+def test_failed_reply_reports_error_and_session_continues(client, monkeypatch):
+    calls = []
+
+    async def flaky_answer(text, db, use_llm=True):
+        calls.append(text)
+        if len(calls) == 1:
+            raise RuntimeError("generation failed")
+        return "Recovered."
+
+    monkeypatch.setattr(voice_route, "generate_bot_response", flaky_answer)
+    with client.websocket_connect(_url()) as ws:
+        ws.send_bytes(SPEECH)
+        ws.send_bytes(SILENCE)
+        assert _receive_reply(ws)[-1]["type"] == "error"
+        ws.send_bytes(SPEECH)
+        ws.send_bytes(SILENCE)
+        frames = _receive_reply(ws)
+    assert [f["text"] for f in frames if f["type"] == "answer"] == ["Recovered."]
+    assert frames[-1]["type"] == "audio_end"
+
+
+def test_vad_rejects_sample_rates_that_would_never_advance():
+    with pytest.raises(ValueError):
+        voice.EnergyVAD(20)
+    assert voice.parse_sample_rate("16000") == 16000
+    assert voice.parse_sample_rate(12345) is None
+
+
+def test_voice_answers_share_the_chat_rate_limit(client, monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_PER_MINUTE", 1.0)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_BURST", 1.0)
+    with client.websocket_connect(_url()) as ws:
+        ws.send_bytes(SPEECH)
+        ws.send_bytes(SILENCE)
+        assert _receive_reply(ws)[-1]["type"] == "audio_end"
+        ws.send_bytes(SPEECH)
+        ws.send_bytes(SILENCE)
+        error = _receive_reply(ws)[-1]
+    assert error["type"] == "error"
+    assert error["status"] == 429
+    assert error["retry_after"] >= 1
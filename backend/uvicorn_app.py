@@ -1,6 +1,16 @@
-import uvicorn
+import os
 
-if __name__ == "__main__":
-	uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+import uvicorn
 
+# APP_PROFILE=api serves auth + chat history without loading the NLP stack;
+# APP_PROFILE=inference serves generation/voice/admin (see app/factory.py).
+ENTRY_POINTS = {
+	"all": "app.main:app",
+	"api": "app.api_app:app",
+	"inference": "app.inference_app:app",
+}
 
+if __name__ == "__main__":
+	profile = os.getenv("APP_PROFILE", "all")
+	port = int(os.getenv("PORT", "8000"))
+	uvicorn.run(ENTRY_POINTS[profile], host="0.0.0.0", port=port, reload=True)